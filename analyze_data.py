@@ -1,16 +1,18 @@
-import json
+from dataset_stats import compute_stats
 
-with open('chess_training_data.json', 'r', encoding='utf-8') as f:
-    data = json.load(f)
+# 单遍流式统计（JSON逐个对象增量解析，不一次性载入），见 dataset_stats
+stats = compute_stats('chess_training_data.json').summary()
 
-print(f'Total samples: {len(data)}')
-print(f'Samples with eval: {sum(1 for s in data if abs(s["eval"]) > 0.01)}')
-print(f'Samples with only result: {sum(1 for s in data if abs(s["eval"]) <= 0.01)}')
+total = stats['samples']
+print(f'Total samples: {total}')
+print(f'Samples with eval: {stats["labelled"]}')
+print(f'Samples with only result: {total - stats["labelled"]}')
 
-evals = [s['eval'] for s in data if abs(s['eval']) > 0.01]
-if evals:
-    print(f'Eval range: {min(evals):.2f} to {max(evals):.2f}')
-    print(f'Eval average: {sum(evals)/len(evals):.4f}')
+# 评估值范围和平均值只统计有评估值的样本（|eval| > 0.01）
+if stats['labelled']:
+    print(f'Eval range: {stats["labelled_eval_min"]:.2f} to {stats["labelled_eval_max"]:.2f}')
+    print(f'Eval average: {stats["labelled_eval_mean"]:.4f}')
 
-results = [s['result'] for s in data]
-print(f'Results - White wins: {results.count(1.0)}, Black wins: {results.count(-1.0)}, Draws: {results.count(0.0)}')
\ No newline at end of file
+results = stats['results']
+print(f'Results - White wins: {results["white_wins"]}, Black wins: {results["black_wins"]}, '
+      f'Draws: {results["draws"]}')
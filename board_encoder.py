@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+棋盘编码器 - 将棋盘状态转换为8x8x12的张量（所有工具共用）
+直接读取python-chess每种棋子的位棋盘(bitboard)，用NumPy按位展开，不再逐格循环
+
+编码布局与固件 fen_to_tensor 一致:
+    tensor[row, col, plane]，row = 方格 // 8（第1横排为row 0），col = 方格 % 8
+    plane 0-5: 白方 P N B R Q K，plane 6-11: 黑方 p n b r q k
+
+压缩格式: 每个局面保存为12个uint64位棋盘（96字节，float32张量为3KB），
+数据集和训练时保持压缩形式，按批次再展开为浮点平面
+"""
+
+import chess
+import numpy as np
+
+NUM_PLANES = 12
+
+
+def board_bitboards(board):
+    """返回12个位棋盘（uint64），顺序与张量平面一致"""
+    white = board.occupied_co[chess.WHITE]
+    black = board.occupied_co[chess.BLACK]
+    pieces = (board.pawns, board.knights, board.bishops,
+              board.rooks, board.queens, board.kings)
+    return [mask & white for mask in pieces] + [mask & black for mask in pieces]
+
+
+def unpack_bitboards(bitboards, out=None):
+    """
+    将 (N, 12) 的uint64位棋盘展开为 (N, 8, 8, 12) 的float32张量
+    out: 可选的预分配数组，形状为 (N, 8, 8, 12)
+    """
+    bitboards = np.asarray(bitboards, dtype='<u8').reshape(-1, NUM_PLANES)
+    count = bitboards.shape[0]
+
+    # 每个位棋盘按小端展开为64位，第i位即方格i
+    bits = np.unpackbits(bitboards.view(np.uint8).reshape(count, NUM_PLANES * 8),
+                         axis=1, bitorder='little')
+    planes = bits.reshape(count, NUM_PLANES, 64).transpose(0, 2, 1).reshape(count, 8, 8, NUM_PLANES)
+
+    if out is None:
+        return planes.astype(np.float32)
+    out[:count] = planes
+    return out
+
+
+def flip_bitboards(bitboards):
+    """
+    颜色翻转: 棋盘上下镜像并交换黑白双方（即 chess.Board.mirror()），(N, 12) -> (N, 12)
+    上下镜像即把每个uint64按字节反转（第1横排与第8横排互换），黑白交换即前后6个平面互换
+    """
+    bitboards = np.asarray(bitboards, dtype=np.uint64).reshape(-1, NUM_PLANES)
+    half = NUM_PLANES // 2
+    return np.concatenate([bitboards[:, half:], bitboards[:, :half]], axis=1).byteswap()
+
+
+def board_to_packed(board):
+    """将棋盘状态压缩为12个uint64位棋盘"""
+    return np.array(board_bitboards(board), dtype=np.uint64)
+
+
+def pack_planes(planes):
+    """将 (N, 8, 8, 12) 或 (8, 8, 12) 的平面张量压缩为 (N, 12) 的uint64位棋盘"""
+    planes = np.asarray(planes).reshape(-1, 64, NUM_PLANES)
+    bits = (planes > 0.5).transpose(0, 2, 1)
+    packed = np.packbits(bits, axis=-1, bitorder='little')
+    return np.ascontiguousarray(packed).view('<u8').reshape(-1, NUM_PLANES).astype(np.uint64)
+
+
+def board_to_tensor(board):
+    """将棋盘状态转换为8x8x12的张量"""
+    return unpack_bitboards(board_bitboards(board))[0]
+
+
+def boards_to_tensor(boards, out=None):
+    """
+    批量编码棋盘
+    out: 预分配的 (N, 8, 8, 12) float32 数组，为None时新建
+    """
+    bitboards = np.array([board_bitboards(board) for board in boards], dtype=np.uint64)
+    if out is None:
+        out = np.empty((len(bitboards), 8, 8, NUM_PLANES), dtype=np.float32)
+    return unpack_bitboards(bitboards, out)
+
+
+def fen_to_tensor(fen):
+    """将FEN字符串转换为8x8x12的张量"""
+    return board_to_tensor(chess.Board(fen))
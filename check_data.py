@@ -1,25 +1,16 @@
-import json
+from dataset_io import iter_samples
+from dataset_stats import compute_stats
 
-# 加载数据
-with open('chess_training_data_with_eval.json', 'r') as f:
-    data = json.load(f)
+# 数据集路径（二进制分片数据集或JSON，单遍流式统计，见 dataset_stats）
+data_path = 'chess_training_data_with_eval'
 
-print(f"Total samples: {len(data)}")
-print(f"\nFirst sample keys: {list(data[0].keys())}")
-print(f"Sample eval: {data[0]['eval']}")
-print(f"Sample result: {data[0]['result']}")
-print(f"Sample move: {data[0]['move']}")
-
-# 统计评估值分布
-evals = [s['eval'] for s in data]
-print(f"\nEvaluation statistics:")
-print(f"  Min: {min(evals):.3f}")
-print(f"  Max: {max(evals):.3f}")
-print(f"  Avg: {sum(evals)/len(evals):.3f}")
-
-# 统计结果分布
-results = [s['result'] for s in data]
-print(f"\nResult distribution:")
-print(f"  White wins: {results.count(1.0)}")
-print(f"  Black wins: {results.count(-1.0)}")
-print(f"  Draws: {results.count(0.0)}")
\ No newline at end of file
+sample = next(iter_samples(data_path), None)
+if sample is None:
+    print("Dataset is empty")
+else:
+    print(f"First sample keys: {list(sample.keys())}")
+    print(f"Sample eval: {sample['eval']}")
+    print(f"Sample result: {sample['result']}")
+    print(f"Sample move: {sample['move']}")
+    print()
+    compute_stats(data_path).report()
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+训练数据集读写
+二进制分片格式: 目录下若干定长记录文件 shard-NNNNN.bin 和一个 manifest.json，
+每条记录包含压缩棋盘(12个uint64位棋盘)、评估值、对局结果、走法，
+以及标注时使用的搜索深度和节点数（没有引擎评估的样本为0）、评估值来源和对局编号
+（同一局的样本编号相同，用于按对局划分训练集和验证集），
+读取时通过内存映射直接访问，无需解析文本或在内存中保留完整副本
+仍兼容旧的JSON样本列表格式（输出路径以 .json 结尾时写JSON），
+读取JSON时逐个对象增量解析，不一次性载入整个文件
+"""
+
+import json
+import os
+
+import numpy as np
+
+from board_encoder import NUM_PLANES, pack_planes
+
+DATASET_FORMAT = 'chess-shards'
+DATASET_VERSION = 4
+MANIFEST_FILE = 'manifest.json'
+
+# 增量解析JSON时每次读取的字符数
+JSON_CHUNK_SIZE = 1 << 20
+
+# 评估值来源: 引擎搜索、评估缓存、PGN中的 [%eval] 注释（none 表示未记录）
+LABEL_SOURCES = ('none', 'engine', 'cache', 'annotation')
+
+# 训练目标的刻度: 评估值除以 TARGET_SCALE 后截断到[-1, 1]，模型输出也在这个刻度上
+TARGET_SCALE = 10.0
+
+RECORD_DTYPE = np.dtype([
+    ('board_bits', '<u8', (NUM_PLANES,)),
+    ('eval', '<f4'),
+    ('result', '<f4'),
+    ('move', 'S5'),
+    ('depth', '<u2'),
+    ('nodes', '<u8'),
+    ('source', 'u1'),
+    ('game', '<u4'),
+])
+
+
+def sample_board_bits(sample):
+    """取出样本的压缩棋盘，旧格式的 board_state 会先压缩"""
+    if 'board_bits' in sample:
+        return sample['board_bits']
+    return pack_planes(sample['board_state'])[0]
+
+
+def eval_to_target(values):
+    """把评估值换算为训练目标（模型输出）的刻度"""
+    return np.clip(np.asarray(values) / TARGET_SCALE, -1, 1)
+
+
+def fill_record(record, sample):
+    """把一个样本字典写入一条 RECORD_DTYPE 记录"""
+    record['board_bits'] = sample_board_bits(sample)
+    record['eval'] = sample['eval']
+    record['result'] = sample['result']
+    record['move'] = sample['move'].encode('ascii')
+    record['depth'] = sample.get('depth', 0)
+    record['nodes'] = sample.get('nodes', 0)
+    record['source'] = LABEL_SOURCES.index(sample.get('source', 'none'))
+    record['game'] = sample.get('game', 0)
+
+
+class ShardWriter:
+    """
+    把样本追加写入二进制分片数据集
+    resume_state: checkpoint() 返回的状态，用于中断后继续写入，
+    检查点之后写入的记录会被截掉
+    """
+
+    def __init__(self, output_dir, shard_size=1000000, buffer_size=4096, resume_state=None):
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        self.shards = []
+        self.count = 0
+        self.buffer = np.zeros(buffer_size, dtype=RECORD_DTYPE)
+        self.buffered = 0
+        os.makedirs(output_dir, exist_ok=True)
+        if resume_state:
+            self._resume(resume_state['count'])
+
+    def _resume(self, count):
+        with open(os.path.join(self.output_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if np.dtype([tuple(field) for field in manifest['dtype']]) != RECORD_DTYPE:
+            raise ValueError(f"数据集记录格式与当前版本不同，无法继续写入: {self.output_dir}")
+
+        remaining = count
+        for shard in manifest['shards']:
+            path = os.path.join(self.output_dir, shard['file'])
+            keep = min(remaining, shard['count'])
+            if keep:
+                with open(path, 'r+b') as f:
+                    f.truncate(keep * RECORD_DTYPE.itemsize)
+                self.shards.append({'file': shard['file'], 'count': keep})
+            elif os.path.exists(path):
+                os.remove(path)
+            remaining -= keep
+
+        self.count = count - remaining
+        self._write_manifest()
+
+    def write(self, sample):
+        fill_record(self.buffer[self.buffered], sample)
+        self.buffered += 1
+        self.count += 1
+        if self.buffered == len(self.buffer):
+            self.flush()
+
+    def write_records(self, records):
+        """直接追加一批 RECORD_DTYPE 记录（如 iter_record_batches 的输出）"""
+        self.flush()
+        self._append(records)
+        self.count += len(records)
+        self._write_manifest()
+
+    def flush(self):
+        """把缓冲区写入分片文件，并更新manifest"""
+        self._append(self.buffer[:self.buffered])
+        self.buffered = 0
+        self._write_manifest()
+
+    def _append(self, records):
+        start = 0
+        while start < len(records):
+            if not self.shards or self.shards[-1]['count'] >= self.shard_size:
+                self.shards.append({'file': f'shard-{len(self.shards):05d}.bin', 'count': 0})
+            shard = self.shards[-1]
+            n = min(len(records) - start, self.shard_size - shard['count'])
+            mode = 'ab' if shard['count'] else 'wb'
+            with open(os.path.join(self.output_dir, shard['file']), mode) as f:
+                records[start:start + n].tofile(f)
+            shard['count'] += n
+            start += n
+
+    def _write_manifest(self):
+        manifest = {
+            'format': DATASET_FORMAT,
+            'version': DATASET_VERSION,
+            'dtype': [list(field) for field in RECORD_DTYPE.descr],
+            'record_size': RECORD_DTYPE.itemsize,
+            'count': sum(shard['count'] for shard in self.shards),
+            'shards': self.shards,
+        }
+        tmp_file = os.path.join(self.output_dir, MANIFEST_FILE + '.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_file, os.path.join(self.output_dir, MANIFEST_FILE))
+
+    def state(self):
+        """当前写入位置（调用 flush 之后才保证已落盘）"""
+        return {'count': self.count}
+
+    def checkpoint(self):
+        """写出缓冲区并返回可用于继续写入的状态"""
+        self.flush()
+        return self.state()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonSampleWriter:
+    """把样本逐条写入JSON数组（每行一个样本，不缩进）"""
+
+    def __init__(self, output_file, resume_state=None):
+        if resume_state:
+            # 截掉检查点之后写入的内容，继续追加
+            self.count = resume_state['count']
+            self.file = open(output_file, 'r+', encoding='utf-8')
+            self.file.seek(resume_state['offset'])
+            self.file.truncate()
+        else:
+            self.count = 0
+            self.file = open(output_file, 'w', encoding='utf-8')
+            self.file.write('[\n')
+
+    def write(self, sample):
+        if self.count:
+            self.file.write(',\n')
+        self.file.write(json.dumps(sample))
+        self.count += 1
+
+    def state(self):
+        return {'count': self.count, 'offset': self.file.tell()}
+
+    def flush(self):
+        self.file.flush()
+
+    def checkpoint(self):
+        self.flush()
+        return self.state()
+
+    def close(self):
+        self.file.write('\n]\n')
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def create_writer(output_path, resume_state=None, **kwargs):
+    """按输出路径选择格式: 以 .json 结尾写JSON，否则写二进制分片目录"""
+    if output_path.endswith('.json'):
+        return JsonSampleWriter(output_path, resume_state)
+    return ShardWriter(output_path, resume_state=resume_state, **kwargs)
+
+
+def is_shard_dataset(path):
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+class ShardedDataset:
+    """以内存映射方式打开二进制分片数据集"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != DATASET_FORMAT:
+            raise ValueError(f"不是分片数据集: {path}")
+
+        self.dtype = np.dtype([tuple(field) for field in self.manifest['dtype']])
+        self.shards = [
+            np.memmap(os.path.join(path, shard['file']), dtype=self.dtype,
+                      mode='r', shape=(shard['count'],))
+            for shard in self.manifest['shards'] if shard['count']
+        ]
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def column(self, name, limit=None):
+        """返回某个字段的按需读取视图（不复制数据）"""
+        return ShardColumn(self, name, limit)
+
+    def take(self, name, indices):
+        """按全局下标读取字段（跨分片）"""
+        indices = np.asarray(indices)
+        shard_ids = np.searchsorted(self.offsets, indices, side='right') - 1
+        # 字段的形状和类型取自 manifest（没有分片的空数据集也能返回空数组）
+        field = self.dtype[name]
+        out = np.empty((len(indices),) + field.shape, dtype=field.base)
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            out[mask] = self.shards[shard_id][name][indices[mask] - self.offsets[shard_id]]
+        return out
+
+    def iter_records(self):
+        for shard in self.shards:
+            yield from shard
+
+
+class ShardColumn:
+    """数据集字段视图，支持 len() 和数组下标访问"""
+
+    def __init__(self, dataset, name, limit=None):
+        self.dataset = dataset
+        self.name = name
+        self.length = len(dataset) if limit is None else min(limit, len(dataset))
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, indices):
+        if isinstance(indices, slice):
+            indices = np.arange(*indices.indices(self.length))
+        return self.dataset.take(self.name, indices)
+
+
+def iter_samples(path):
+    """逐条读取样本（JSON或二进制分片），产出与JSON格式相同的字典"""
+    if is_shard_dataset(path):
+        dataset = ShardedDataset(path)
+        # 旧版本数据集没有 depth/nodes/source/game 字段
+        extra = [name for name in ('depth', 'nodes', 'game') if name in dataset.dtype.names]
+        has_source = 'source' in dataset.dtype.names
+        for record in dataset.iter_records():
+            sample = {
+                'board_bits': [int(bits) for bits in record['board_bits']],
+                'move': record['move'].decode('ascii'),
+                'eval': float(record['eval']),
+                'result': float(record['result']),
+            }
+            for name in extra:
+                sample[name] = int(record[name])
+            if has_source:
+                sample['source'] = LABEL_SOURCES[record['source']]
+            yield sample
+        return
+
+    yield from iter_json_samples(path)
+
+
+def iter_json_samples(path, chunk_size=JSON_CHUNK_SIZE):
+    """
+    增量解析JSON样本数组（生成器），内存只与单个读取块有关:
+    用 JSONDecoder.raw_decode 从缓冲区中逐个解析对象，缓冲区不足一个完整对象时再读入下一块
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"不是JSON样本数组: {path}")
+        pos = 1
+        eof = False
+        while True:
+            # 跳过空白和分隔符
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                buffer = f.read(chunk_size)
+                pos = 0
+                eof = not buffer
+            if pos >= len(buffer) or buffer[pos] == ']':
+                return
+
+            try:
+                sample, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # 对象跨越了读取块的边界，补读后重试
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield sample
+            pos = end
+
+
+def iter_record_batches(path, batch_size=65536):
+    """
+    按批读取数据集（生成器），每批为 RECORD_DTYPE 的结构化数组:
+    当前版本的分片数据集直接产出内存映射的切片（不复制），
+    旧版本分片缺少的字段补0，JSON样本逐个增量解析后填入缓冲区（每批复用同一个缓冲区）
+    """
+    if is_shard_dataset(path):
+        dataset = ShardedDataset(path)
+        common = [name for name in RECORD_DTYPE.names if name in dataset.dtype.names]
+        for shard in dataset.shards:
+            for start in range(0, len(shard), batch_size):
+                chunk = shard[start:start + batch_size]
+                if dataset.dtype == RECORD_DTYPE:
+                    yield chunk
+                    continue
+                batch = np.zeros(len(chunk), dtype=RECORD_DTYPE)
+                for name in common:
+                    batch[name] = chunk[name]
+                yield batch
+        return
+
+    buffer = np.zeros(batch_size, dtype=RECORD_DTYPE)
+    count = 0
+    for sample in iter_json_samples(path):
+        fill_record(buffer[count], sample)
+        count += 1
+        if count == batch_size:
+            yield buffer
+            count = 0
+    if count:
+        yield buffer[:count]
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+数据集统计 - 单遍流式读取，内存占用与数据集大小无关
+支持二进制分片数据集和旧的JSON样本列表（逐个对象增量解析，见 dataset_io），
+按批向量化统计:
+    评估值直方图、截断(|eval|=1，即超过±1000cp)和将杀(|eval|=0.9)的比例、评估值为0的比例
+    对局结果分布、评估值来源和搜索深度
+    按Zobrist哈希估计的重复率（HyperLogLog 估计不同局面数，误差约1%）
+    棋子数和按子力划分的对局阶段分布
+读取JSON时可以同时转换为二进制分片数据集
+
+用法: python dataset_stats.py <数据集> [--convert <输出目录>]
+"""
+
+import sys
+
+import chess
+import chess.polyglot
+import numpy as np
+
+from board_encoder import NUM_PLANES
+from dataset_io import LABEL_SOURCES, ShardWriter, is_shard_dataset, iter_record_batches
+from position_sampler import ENDGAME_MATERIAL, PHASE_MATERIAL
+
+EVAL_BINS = 20
+MATE_EVAL = np.float32(0.9)
+
+# |eval| 超过该值才算有评估值（与训练时选择评估值还是对局结果作为目标的阈值相同）
+LABELLED_EVAL = 0.01
+
+# 双方的马、象、车、后都还在（子力阶段值62）视为开局
+OPENING_MATERIAL = 2 * sum(PHASE_MATERIAL[piece] * count for piece, count in
+                           ((chess.KNIGHT, 2), (chess.BISHOP, 2), (chess.ROOK, 2), (chess.QUEEN, 1)))
+
+# 平面 i 中各类棋子的子力阶段值（兵和王为0）
+PLANE_MATERIAL = np.array([PHASE_MATERIAL.get(piece_type, 0)
+                           for _ in range(2) for piece_type in chess.PIECE_TYPES], dtype=np.int32)
+
+# 12个平面 x 64个方格的Polyglot Zobrist键（白方棋子的编号为 (类型-1)*2+1，黑方为 (类型-1)*2）
+ZOBRIST_KEYS = np.array([
+    [chess.polyglot.POLYGLOT_RANDOM_ARRAY[64 * ((plane % 6) * 2 + (plane < 6)) + square]
+     for square in range(64)]
+    for plane in range(NUM_PLANES)
+], dtype=np.uint64)
+
+HLL_PRECISION = 14
+
+# 展开位棋盘时的子批大小（每个子批占用约 子批 x 64 x 8 字节的临时内存）
+HASH_CHUNK = 16384
+
+
+def board_zobrist(board_bits):
+    """
+    (N, 12) 位棋盘的Zobrist哈希（只含棋子位置，数据集中没有走棋方、易位和吃过路兵信息）
+    同时返回每个平面的棋子数 (N, 12)
+    """
+    count = len(board_bits)
+    bits = np.unpackbits(np.ascontiguousarray(board_bits, dtype='<u8').view(np.uint8)
+                         .reshape(count, NUM_PLANES, 8), axis=2, bitorder='little').astype(bool)
+    hashes = np.zeros(count, dtype=np.uint64)
+    for plane in range(NUM_PLANES):
+        hashes ^= np.bitwise_xor.reduce(np.where(bits[:, plane], ZOBRIST_KEYS[plane], np.uint64(0)), axis=1)
+    return hashes, bits.sum(axis=2)
+
+
+class HyperLogLog:
+    """HyperLogLog 基数估计，2^precision 个寄存器，标准误差约 1.04 / sqrt(2^precision)"""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, hashes):
+        width = 64 - self.precision
+        index = (hashes >> np.uint64(width)).astype(np.intp)
+        rest = hashes & np.uint64((1 << width) - 1)
+        # 剩余位中第一个1的位置（从高位数起）；width < 53，转换为float64不损失精度
+        _, exponent = np.frexp(rest.astype(np.float64))
+        rank = (width - exponent + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class DatasetStats:
+    def __init__(self):
+        self.count = 0
+        self.eval_sum = 0.0
+        self.eval_sq_sum = 0.0
+        self.eval_min = np.inf
+        self.eval_max = -np.inf
+        self.eval_hist = np.zeros(EVAL_BINS, dtype=np.int64)
+        self.clipped = 0
+        self.mates = 0
+        self.zero_evals = 0
+        self.labelled = 0
+        self.labelled_sum = 0.0
+        self.labelled_min = np.inf
+        self.labelled_max = -np.inf
+        self.results = {1.0: 0, -1.0: 0, 0.0: 0}
+        self.other_results = 0
+        self.sources = np.zeros(len(LABEL_SOURCES), dtype=np.int64)
+        self.depth_sum = 0
+        self.depth_count = 0
+        self.depth_max = 0
+        self.piece_counts = np.zeros(33, dtype=np.int64)
+        self.phases = {'opening': 0, 'middlegame': 0, 'endgame': 0}
+        self.positions = HyperLogLog()
+
+    def update(self, records):
+        """累加一批 RECORD_DTYPE 记录"""
+        self.count += len(records)
+
+        evals = records['eval'].astype(np.float64)
+        self.eval_sum += evals.sum()
+        self.eval_sq_sum += np.square(evals).sum()
+        self.eval_min = min(self.eval_min, evals.min())
+        self.eval_max = max(self.eval_max, evals.max())
+        self.eval_hist += np.histogram(np.clip(evals, -1.0, 1.0), bins=EVAL_BINS, range=(-1.0, 1.0))[0]
+        magnitude = np.abs(records['eval'])
+        self.clipped += np.count_nonzero(magnitude >= 1.0)
+        self.mates += np.count_nonzero(magnitude == MATE_EVAL)
+        self.zero_evals += np.count_nonzero(magnitude == 0.0)
+        labelled = evals[np.abs(evals) > LABELLED_EVAL]
+        if len(labelled):
+            self.labelled += len(labelled)
+            self.labelled_sum += labelled.sum()
+            self.labelled_min = min(self.labelled_min, labelled.min())
+            self.labelled_max = max(self.labelled_max, labelled.max())
+
+        results = records['result']
+        for value in self.results:
+            self.results[value] += np.count_nonzero(results == value)
+        self.other_results += len(records) - np.count_nonzero(np.isin(results, list(self.results)))
+
+        self.sources += np.bincount(records['source'], minlength=len(LABEL_SOURCES))[:len(LABEL_SOURCES)]
+        depths = records['depth']
+        searched = depths[depths > 0]
+        if len(searched):
+            self.depth_sum += int(searched.sum())
+            self.depth_count += len(searched)
+            self.depth_max = max(self.depth_max, int(searched.max()))
+
+        for start in range(0, len(records), HASH_CHUNK):
+            hashes, plane_counts = board_zobrist(records['board_bits'][start:start + HASH_CHUNK])
+            self.positions.add(hashes)
+            self.piece_counts += np.bincount(plane_counts.sum(axis=1), minlength=33)[:33]
+            material = plane_counts @ PLANE_MATERIAL
+            endgame = np.count_nonzero(material <= ENDGAME_MATERIAL)
+            opening = np.count_nonzero(material >= OPENING_MATERIAL)
+            self.phases['endgame'] += endgame
+            self.phases['opening'] += opening
+            self.phases['middlegame'] += len(material) - endgame - opening
+
+    def summary(self):
+        """返回统计结果字典"""
+        count = self.count or 1
+        mean = self.eval_sum / count
+        distinct = min(self.positions.count(), self.count)
+        return {
+            'samples': self.count,
+            'eval_mean': mean,
+            'eval_std': float(np.sqrt(max(self.eval_sq_sum / count - mean * mean, 0.0))),
+            'eval_min': float(self.eval_min) if self.count else 0.0,
+            'eval_max': float(self.eval_max) if self.count else 0.0,
+            'eval_histogram': self.eval_hist.tolist(),
+            'clipped_fraction': self.clipped / count,
+            'mate_fraction': self.mates / count,
+            'zero_eval_fraction': self.zero_evals / count,
+            # 只统计有评估值的样本（|eval| > LABELLED_EVAL）
+            'labelled': self.labelled,
+            'labelled_eval_mean': self.labelled_sum / self.labelled if self.labelled else 0.0,
+            'labelled_eval_min': float(self.labelled_min) if self.labelled else 0.0,
+            'labelled_eval_max': float(self.labelled_max) if self.labelled else 0.0,
+            'results': {'white_wins': self.results[1.0], 'black_wins': self.results[-1.0],
+                        'draws': self.results[0.0], 'other': self.other_results},
+            'sources': dict(zip(LABEL_SOURCES, self.sources.tolist())),
+            'mean_depth': self.depth_sum / self.depth_count if self.depth_count else 0.0,
+            'max_depth': self.depth_max,
+            'distinct_positions': distinct,
+            'duplicate_fraction': 1.0 - distinct / count if self.count else 0.0,
+            'piece_counts': {n: int(c) for n, c in enumerate(self.piece_counts) if c},
+            'phases': dict(self.phases),
+        }
+
+    def report(self):
+        stats = self.summary()
+        count = self.count or 1
+        print(f"Total samples: {stats['samples']}")
+
+        print("\nEvaluation statistics:")
+        print(f"  Min: {stats['eval_min']:.3f}  Max: {stats['eval_max']:.3f}  "
+              f"Avg: {stats['eval_mean']:.3f}  Std: {stats['eval_std']:.3f}")
+        print(f"  Clipped (|eval| >= 1): {stats['clipped_fraction']:.1%}")
+        print(f"  Mate scores (|eval| = 0.9): {stats['mate_fraction']:.1%}")
+        print(f"  Zero eval (unlabelled or level): {stats['zero_eval_fraction']:.1%}")
+        if self.labelled:
+            print(f"  Labelled (|eval| > {LABELLED_EVAL}): {stats['labelled']}, "
+                  f"Min: {stats['labelled_eval_min']:.3f}  Max: {stats['labelled_eval_max']:.3f}  "
+                  f"Avg: {stats['labelled_eval_mean']:.3f}")
+        peak = max(self.eval_hist.max(), 1)
+        width = 2.0 / EVAL_BINS
+        for i, n in enumerate(self.eval_hist):
+            low = -1.0 + i * width
+            print(f"  [{low:+.1f}, {low + width:+.1f}) {n:9d} {'#' * int(40 * n / peak)}")
+
+        results = stats['results']
+        print("\nResult distribution:")
+        print(f"  White wins: {results['white_wins']}")
+        print(f"  Black wins: {results['black_wins']}")
+        print(f"  Draws: {results['draws']}")
+        if results['other']:
+            print(f"  Other: {results['other']}")
+
+        print("\nLabel sources:")
+        for source, n in stats['sources'].items():
+            if n:
+                print(f"  {source}: {n} ({n / count:.1%})")
+        if self.depth_count:
+            print(f"  Search depth: avg {stats['mean_depth']:.1f}, max {stats['max_depth']}")
+
+        print("\nPositions:")
+        print(f"  Distinct (estimated): {stats['distinct_positions']}")
+        print(f"  Duplicate rate: {stats['duplicate_fraction']:.1%}")
+        print("  Phases: " + ", ".join(f"{phase} {n / count:.1%}" for phase, n in stats['phases'].items()))
+        print("  Piece counts: " + ", ".join(f"{n}:{c}" for n, c in stats['piece_counts'].items()))
+
+
+def compute_stats(path, convert_to=None, batch_size=65536):
+    """
+    单遍统计数据集；convert_to 给出时同时把记录写入该目录的二进制分片数据集
+    （旧版本分片缺少的字段补0）
+    """
+    stats = DatasetStats()
+    writer = ShardWriter(convert_to) if convert_to else None
+    for batch in iter_record_batches(path, batch_size):
+        stats.update(batch)
+        if writer is not None:
+            writer.write_records(batch)
+    if writer is not None:
+        writer.close()
+        print(f"Converted {writer.count} samples to {convert_to}")
+    return stats
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("用法: python dataset_stats.py <数据集> [--convert <输出目录>]")
+        return
+
+    path = sys.argv[1]
+    convert_to = None
+    if len(sys.argv) > 3 and sys.argv[2] == '--convert':
+        convert_to = sys.argv[3]
+        if is_shard_dataset(path) and convert_to == path:
+            print("输出目录不能与输入数据集相同")
+            return
+
+    compute_stats(path, convert_to).report()
+
+
+if __name__ == "__main__":
+    main()
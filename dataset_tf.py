@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+tf.data 流式输入 - 直接从二进制分片文件读取训练数据（见 dataset_io）
+不把数据集载入内存: 按定长记录读取分片文件（多个分片交错并行读取），
+按对局编号确定性地划分训练集/验证集，训练集经过洗牌缓冲区，
+成批后并行解码（位棋盘展开为8x8x12平面），并预取下一批
+augment=True 时训练集每个样本以50%概率做颜色翻转（上下镜像、交换黑白平面、评估值取反），
+在解码前对压缩的位棋盘字节按批向量化完成，不改动磁盘上的数据
+
+记录按主机字节序解码（分片文件为小端格式，适用于x86/ARM）
+没有对局编号的旧版本数据集按连续 LEGACY_GAME_BLOCK 条记录近似为一局
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from board_encoder import NUM_PLANES
+from dataset_io import MANIFEST_FILE, TARGET_SCALE
+
+LEGACY_GAME_BLOCK = 64
+
+BIT_SHIFTS = np.arange(8, dtype=np.uint8)
+
+# 划分验证集时对局编号的哈希桶数
+SPLIT_BUCKETS = 1000
+
+
+def load_manifest(path):
+    with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    dtype = np.dtype([tuple(field) for field in manifest['dtype']])
+    return manifest, dtype
+
+
+def _field(records, dtype, name, out_type):
+    """从 (N, record_size) 的uint8记录中取出一个标量字段"""
+    field_dtype, offset = dtype.fields[name][:2]
+    raw = records[:, offset:offset + field_dtype.itemsize]
+    if field_dtype.itemsize == 1:
+        return tf.cast(raw[:, 0], out_type)
+    return tf.cast(tf.bitcast(raw, tf.as_dtype(field_dtype.newbyteorder('='))), out_type)
+
+
+def board_bytes(records, dtype):
+    """(N, record_size) 的uint8记录 -> (N, 12, 8) 位棋盘字节（每个平面8字节，第i字节为第i+1横排）"""
+    offset = dtype.fields['board_bits'][1]
+    return tf.reshape(records[:, offset:offset + NUM_PLANES * 8], (-1, NUM_PLANES, 8))
+
+
+def flip_board_bytes(board_bytes):
+    """颜色翻转（同 board_encoder.flip_bitboards）: 横排字节倒序，前后6个平面互换"""
+    return tf.roll(tf.reverse(board_bytes, axis=[2]), shift=NUM_PLANES // 2, axis=1)
+
+
+def random_flip(board_bytes, y, probability=0.5):
+    """每个样本以 probability 的概率做颜色翻转，评估值（白方视角）随之取反"""
+    flip = tf.random.uniform(tf.shape(y)) < probability
+    board_bytes = tf.where(flip[:, None, None], flip_board_bytes(board_bytes), board_bytes)
+    return board_bytes, tf.where(flip, -y, y)
+
+
+def decode_planes(board_bytes):
+    """(N, 12, 8) 位棋盘字节 -> (N, 8, 8, 12) float32，布局与 board_encoder.unpack_bitboards 相同"""
+    # 每个字节按小端展开为8位: 第k位即方格 8*字节序号+k
+    bits = tf.bitwise.bitwise_and(
+        tf.bitwise.right_shift(board_bytes[..., None], BIT_SHIFTS), 1)
+    planes = tf.reshape(bits, (-1, NUM_PLANES, 64))
+    planes = tf.transpose(planes, (0, 2, 1))
+    return tf.cast(tf.reshape(planes, (-1, 8, 8, NUM_PLANES)), tf.float32)
+
+
+def decode_targets(records, dtype):
+    """训练目标: 有评估值时用评估值，否则用对局结果，换算到训练目标的刻度（与 dataset_io.eval_to_target 相同）"""
+    y_eval = _field(records, dtype, 'eval', tf.float32)
+    y_result = _field(records, dtype, 'result', tf.float32)
+    y = tf.where(tf.abs(y_eval) > 0.01, y_eval, y_result)
+    return tf.clip_by_value(y / TARGET_SCALE, -1.0, 1.0)
+
+
+def _game_ids(index, records, dtype):
+    if 'game' in dtype.names:
+        return _field(records, dtype, 'game', tf.int64)
+    return index // LEGACY_GAME_BLOCK
+
+
+def is_validation(game_ids, val_fraction):
+    """按对局编号的哈希确定性划分: 同一局的样本总在同一侧，与读取顺序和洗牌无关"""
+    buckets = tf.strings.to_hash_bucket_fast(tf.strings.as_string(game_ids), SPLIT_BUCKETS)
+    return buckets < int(round(val_fraction * SPLIT_BUCKETS))
+
+
+def make_dataset(path, split='train', batch_size=128, val_fraction=0.2, max_samples=None,
+                 shuffle_buffer=100000, seed=42, read_parallelism=4, augment=False):
+    """
+    从分片数据集创建 tf.data 输入管线，产出 (planes, y) 批次
+    split: 'train'（洗牌，分片顺序每轮打乱）或 'val'（固定顺序）
+    max_samples: 只使用按全局顺序的前N条记录（划分之前截取，与 load_data 一致）
+    augment: 训练集随机颜色翻转（验证集不翻转）
+    """
+    manifest, dtype = load_manifest(path)
+    record_size = dtype.itemsize
+
+    files, starts, counts = [], [], []
+    start = 0
+    for shard in manifest['shards']:
+        count = shard['count'] if max_samples is None else min(shard['count'], max_samples - start)
+        if count > 0:
+            files.append(os.path.join(path, shard['file']))
+            starts.append(start)
+            counts.append(count)
+            start += count
+
+    training = split == 'train'
+    shards = tf.data.Dataset.from_tensor_slices((files, tf.constant(starts, dtype=tf.int64),
+                                                 tf.constant(counts, dtype=tf.int64)))
+    if training:
+        shards = shards.shuffle(len(files), seed=seed, reshuffle_each_iteration=True)
+
+    def read_shard(file, first_index, count):
+        # 每条记录带上全局下标（与交错读取的顺序无关）
+        records = tf.data.FixedLengthRecordDataset(file, record_size, buffer_size=1 << 20)
+        return records.take(count).enumerate(first_index)
+
+    records = shards.interleave(read_shard, cycle_length=min(read_parallelism, len(files)) or 1,
+                                num_parallel_calls=tf.data.AUTOTUNE, deterministic=not training)
+
+    def in_split(index, record):
+        raw = tf.io.decode_raw(record, tf.uint8)[None, :]
+        validation = is_validation(_game_ids(index[None], raw, dtype), val_fraction)[0]
+        return validation if split == 'val' else tf.logical_not(validation)
+
+    records = records.filter(in_split)
+    if training and shuffle_buffer:
+        records = records.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+
+    flip = training and augment
+
+    def decode(_, batch):
+        raw = tf.io.decode_raw(batch, tf.uint8)
+        boards, y = board_bytes(raw, dtype), decode_targets(raw, dtype)
+        if flip:
+            boards, y = random_flip(boards, y)
+        return decode_planes(boards), y
+
+    batches = records.batch(batch_size).map(decode, num_parallel_calls=tf.data.AUTOTUNE,
+                                            deterministic=not training)
+    return batches.prefetch(tf.data.AUTOTUNE)
+
+
+def benchmark_input(dataset, steps=50):
+    """只迭代输入管线，返回每秒产出的批次数（与训练的 steps/sec 比较，判断输入是否是瓶颈）"""
+    iterator = iter(dataset)
+    next(iterator, None)  # 第一批包含管线初始化和洗牌缓冲区填充
+    start = time.perf_counter()
+    count = 0
+    for _ in range(steps):
+        if next(iterator, None) is None:
+            break
+        count += 1
+    elapsed = time.perf_counter() - start
+    return count / elapsed if elapsed else 0.0
+
+
+class StepRateLogger(keras.callbacks.Callback):
+    """每轮结束时打印训练的 steps/sec 和 samples/sec（不含验证时间）"""
+
+    def __init__(self, batch_size, input_rate=None):
+        super().__init__()
+        self.batch_size = batch_size
+        self.input_rate = input_rate
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.steps = 0
+        self.start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.steps += 1
+
+    def on_test_begin(self, logs=None):
+        self.elapsed = time.perf_counter() - self.start
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = getattr(self, 'elapsed', None) or time.perf_counter() - self.start
+        rate = self.steps / elapsed if elapsed else 0.0
+        line = f"  训练速度: {rate:.1f} steps/sec, {rate * self.batch_size:.0f} samples/sec"
+        if self.input_rate:
+            line += f"（输入管线单独可达 {self.input_rate:.1f} steps/sec，利用率 {rate / self.input_rate:.0%}）"
+        print(line)
+        self.elapsed = None
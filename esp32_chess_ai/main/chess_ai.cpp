@@ -7,6 +7,7 @@
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <math.h>
 #include "freertos/FreeRTOS.h"
 #include "freertos/task.h"
 #include "freertos/queue.h"
@@ -106,8 +107,9 @@ void init_chess_ai() {
     }
 
     // Create op resolver
-    static tflite::MicroMutableOpResolver<10> resolver;
+    static tflite::MicroMutableOpResolver<11> resolver;
     resolver.AddConv2D();
+    resolver.AddDepthwiseConv2D();  // depthwise-separable model variants
     resolver.AddMaxPool2D();
     resolver.AddFullyConnected();
     resolver.AddReshape();
@@ -345,7 +347,18 @@ float evaluate_position() {
 
     // Get input tensor
     TfLiteTensor* input = interpreter->input(0);
-    memcpy(input->data.f, board_input, sizeof(board_input));
+    if (input->type == kTfLiteInt8) {
+        // Full-integer model: planes are 0/1, quantize with the input scale/zero point
+        const float* planes = &board_input[0][0][0];
+        const int zero_point = input->params.zero_point;
+        int on = (int)lroundf(1.0f / input->params.scale) + zero_point;
+        if (on > 127) on = 127;
+        for (int i = 0; i < 8 * 8 * 12; i++) {
+            input->data.int8[i] = (int8_t)(planes[i] > 0.5f ? on : zero_point);
+        }
+    } else {
+        memcpy(input->data.f, board_input, sizeof(board_input));
+    }
 
     // Run inference
     TfLiteStatus invoke_status = interpreter->Invoke();
@@ -359,7 +372,12 @@ float evaluate_position() {
 
     // Get output (evaluation score)
     TfLiteTensor* output = interpreter->output(0);
-    float evaluation = *output->data.f;
+    float evaluation;
+    if (output->type == kTfLiteInt8) {
+        evaluation = (output->data.int8[0] - output->params.zero_point) * output->params.scale;
+    } else {
+        evaluation = *output->data.f;
+    }
 
     return evaluation;
 }
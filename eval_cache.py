@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Stockfish评估缓存 - 以Zobrist哈希为键的持久化缓存（SQLite）
+开局和常见局面在不同对局、不同PGN文件之间大量重复，
+评估过一次的局面保存下来，之后的运行直接复用，不再调用引擎
+
+每个局面只保留搜索深度最高的一条结果；查询时要求缓存深度 >= 请求深度，
+更浅的结果视为未命中（重新评估后会被更深的结果覆盖）
+保存的是引擎原始分数（cp/mate，当前走棋方视角），换算成训练标签在读取后进行，
+修改标签换算方式不会使缓存失效
+"""
+
+import sqlite3
+
+import chess.polyglot
+
+DEFAULT_CACHE_FILE = 'stockfish_eval_cache.sqlite'
+
+# SQLite单条语句的参数个数有上限，批量查询按此分块
+QUERY_CHUNK = 500
+
+SCORE_TYPES = {'cp': 0, 'mate': 1}
+SCORE_NAMES = {value: key for key, value in SCORE_TYPES.items()}
+
+
+def position_key(board):
+    """局面的Zobrist哈希，转换为SQLite可保存的有符号64位整数"""
+    key = chess.polyglot.zobrist_hash(board)
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+
+class EvalCache:
+    """
+    check_same_thread=False 时可以在创建连接以外的线程中使用（同一时间只能有一个线程使用），
+    需要并发读写时每个线程各开一个连接（WAL模式下读写互不阻塞）
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, check_same_thread=True):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS evals ("
+            " key INTEGER PRIMARY KEY,"
+            " depth INTEGER NOT NULL,"
+            " score_type INTEGER NOT NULL,"
+            " score INTEGER NOT NULL)"
+        )
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM evals").fetchone()[0]
+
+    def get_many(self, keys, min_depth):
+        """
+        批量查询，返回 {key: info}，info 格式与 StockfishEvaluator.analyse 相同
+        只返回深度 >= min_depth 的结果
+        """
+        keys = list(set(keys))
+        found = {}
+        for i in range(0, len(keys), QUERY_CHUNK):
+            chunk = keys[i:i + QUERY_CHUNK]
+            rows = self.conn.execute(
+                f"SELECT key, depth, score_type, score FROM evals "
+                f"WHERE depth >= ? AND key IN ({','.join('?' * len(chunk))})",
+                [min_depth] + chunk,
+            )
+            for key, depth, score_type, score in rows:
+                found[key] = {'score_type': SCORE_NAMES[score_type], 'score': score, 'depth': depth}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """
+        批量写入 [(key, depth, info)]，已有更深（或同样深）结果的局面不会被覆盖
+        """
+        rows = [(key, depth, SCORE_TYPES[info['score_type']], info['score'])
+                for key, depth, info in items]
+        if not rows:
+            return
+        self.conn.executemany(
+            "INSERT INTO evals (key, depth, score_type, score) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET depth = excluded.depth, "
+            "score_type = excluded.score_type, score = excluded.score "
+            "WHERE excluded.depth > evals.depth",
+            rows,
+        )
+        self.conn.commit()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
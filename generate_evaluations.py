@@ -4,250 +4,995 @@
 将评估值添加到训练数据中
 """
 
+import asyncio
+import concurrent.futures
+import functools
 import json
-import chess.pgn
-import subprocess
+import queue
+import sys
+import threading
 import time
 import os
-from pathlib import Path
+
+import numpy as np
+
+from board_encoder import board_to_packed, unpack_bitboards
+from dataset_io import create_writer, eval_to_target
+from eval_cache import EvalCache, position_key
+from position_sampler import PositionSampler, SeenKeyLog, game_phase, is_quiet
+from pgn_io import is_compressed
+from pgn_index import iter_pgn_games, map_game_shards, read_games_at, select_entries
+from pgn_mainline import MainlineVisitor, parse_eval_annotation
+from pipeline import POLL_INTERVAL, Pipeline
+from uci_async import AsyncUciEngine, EngineError, parse_info, position_command
+
+def score_to_eval(info, white_to_move=True):
+    """
+    把引擎原始分数换算为 -1 到 1 的评估值（None 表示评估失败）
+    UCI分数是当前走棋方视角，white_to_move=False 时取反，得到白方视角的评估值
+    """
+    if info is None:
+        return None
+    score = info['score'] if white_to_move else -info['score']
+    if info['score_type'] == "cp":
+        # centipawn评估，转换为-1到1范围
+        # 通常 +/-1000cp约为 +/-10分兵，对应 +/-1
+        eval_score = score / 1000.0
+        # 限制在-1到1之间
+        return max(-1.0, min(1.0, eval_score))
+    # 将杀评估，转换为接近-1或1的值
+    if score > 0:
+        return 0.9  # 白方即将获胜
+    return -0.9  # 黑方即将获胜
+
+
+def white_to_move(fen):
+    return fen.split()[1] == 'w'
+
+
+DEFAULT_STOCKFISH_PATH = r"C:\Users\Mia\Documents\esp32chess\stockfish\stockfish\stockfish-windows-x86-64-avx2.exe"
+
 
 class StockfishEvaluator:
-    def __init__(self, stockfish_path=r"C:\Users\Mia\Documents\esp32chess\stockfish\stockfish\stockfish-windows-x86-64-avx2.exe"):
-        """初始化Stockfish评估器"""
+    """
+    同步接口的Stockfish评估器，内部使用 AsyncUciEngine（自带事件循环），
+    读取输出有真正的超时，卡住的引擎会被 stop 或重启，不会无限阻塞
+    """
+
+    def __init__(self, stockfish_path=DEFAULT_STOCKFISH_PATH, threads=None, hash_mb=None,
+                 search_timeout=60):
+        """
+        初始化Stockfish评估器
+        threads/hash_mb: 引擎的 Threads 和 Hash(MB) 选项，None 表示使用引擎默认值
+        search_timeout: 单个位置的最长搜索时间（秒）
+        """
         self.stockfish_path = stockfish_path
-        self.process = None
+        self.threads = threads
+        self.hash_mb = hash_mb
+        self.search_timeout = search_timeout
+        self.engine = None
+        self.loop = None
         self.depth = 15  # 评估深度（15-20之间平衡速度和质量）
 
     def start(self):
         """启动Stockfish进程"""
+        self.loop = asyncio.new_event_loop()
+        self.engine = AsyncUciEngine(self.stockfish_path, self.threads, self.hash_mb,
+                                     self.depth, self.search_timeout)
         try:
-            self.process = subprocess.Popen(
-                [self.stockfish_path],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1,
-                universal_newlines=True
-            )
-
-            # 初始化UCI
-            self.send_command("uci")
-            self.wait_for_response("uciok")
-            self.send_command("setoption name MultiPV value 1")
-
+            self._run(self.engine.start())
             print("[OK] Stockfish started successfully")
             return True
-        except Exception as e:
+        except EngineError as e:
             print(f"[ERROR] Failed to start Stockfish: {e}")
+            self.engine = None
             return False
 
+    def _run(self, coro):
+        return self.loop.run_until_complete(coro)
+
     def send_command(self, command):
         """发送命令到Stockfish"""
-        if self.process:
-            self.process.stdin.write(command + "\n")
-            self.process.stdin.flush()
+        if self.engine:
+            self._run(self.engine.send(command))
 
     def wait_for_response(self, expected_text, timeout=30):
-        """等待Stockfish响应"""
-        start_time = time.time()
-        response_lines = []
+        """等待Stockfish响应，超时返回None"""
+        try:
+            return self._run(self.engine.read_until(expected_text, timeout))
+        except asyncio.TimeoutError:
+            return None
 
-        while time.time() - start_time < timeout:
-            try:
-                line = self.process.stdout.readline()
-                if line:
-                    line = line.strip()
-                    response_lines.append(line)
-                    if expected_text in line:
-                        return response_lines
-            except:
-                pass
+    def evaluate_position(self, fen, depth=None):
+        """评估单个棋盘位置（白方视角）"""
+        return score_to_eval(self.analyse(fen, depth), white_to_move(fen))
 
-        return response_lines
+    def new_game(self):
+        """通知引擎开始新对局（清空置换表），等待引擎就绪"""
+        if self.engine:
+            self._run(self.engine.new_game())
 
-    def evaluate_position(self, fen, depth=None):
-        """评估单个棋盘位置"""
-        if not self.process:
+    def analyse(self, fen, depth=None, nodes=None):
+        """
+        分析单个位置，返回最后一条带分数的info:
+        {'score_type': 'cp'/'mate', 'score': 整数, 'depth': 深度, 'nodes': 节点数}
+        分数为Stockfish原始输出（当前走棋方视角），失败时返回None
+        nodes: 按节点数限制搜索（go nodes），否则按深度搜索
+        """
+        if not self.engine:
             return None
+        return self._run(self.engine.analyse(position_command(fen=fen), depth or self.depth, nodes))
 
-        eval_depth = depth or self.depth
+    def analyse_moves(self, root_fen, moves, depth=None, nodes=None):
+        """
+        沿对局走法分析: 发送 position startpos moves ...（非标准开局为 position fen <root> moves ...），
+        引擎能看到对局历史，连续半回合之间可以复用置换表
+        root_fen 为None表示标准初始局面
+        """
+        if not self.engine:
+            return None
+        command = position_command(root_fen=root_fen, moves=moves)
+        return self._run(self.engine.analyse(command, depth or self.depth, nodes))
 
-        # 设置位置
-        self.send_command(f"position fen {fen}")
+    def parse_info(self, info_line):
+        """从Stockfish的info行中解析原始分数、深度和节点数"""
+        return parse_info(info_line)
 
-        # 开始分析
-        self.send_command(f"go depth {eval_depth}")
+    def parse_evaluation(self, info_line):
+        """从Stockfish输出中解析评估值"""
+        return score_to_eval(parse_info(info_line))
 
-        # 等待结果
-        start_time = time.time()
-        eval_score = None
+    def stop(self):
+        """停止Stockfish进程"""
+        if self.engine:
+            self._run(self.engine.quit())
+            self.engine = None
+            self.loop.close()
+            print("[OK] Stockfish stopped")
+
+
+class AdaptiveDepth:
+    """
+    自适应深度标注策略
+    先做一次浅搜索（shallow，可按深度或节点数限制）和一次中等深度搜索（medium），
+    两者的评估值相差超过 threshold（-1到1的标签尺度，0.1约为100cp）时再做深搜索（deep），
+    否则直接使用中等深度的结果；简单局面（大子优势、强制兑子）不再花费完整深度
+
+    每 calibrate_every 个位置在自适应搜索之后额外做一次校准: 发送 ucinewgame 清空置换表，
+    再做一次固定深度（deep）搜索（结果不用作标签），不受本位置浅/中搜索留在置换表中的结果影响；
+    用校准搜索的平均耗时估算固定深度标注的总耗时，从而报告节省的引擎时间；
+    校准耗时单独统计，不计入自适应标注的引擎时间
+    """
+
+    def __init__(self, shallow=None, medium=12, deep=18, threshold=0.1, calibrate_every=50):
+        self.shallow = shallow or {'depth': 8}
+        self.medium = medium
+        self.deep = deep
+        self.threshold = threshold
+        self.calibrate_every = calibrate_every
+        self.stats = {'positions': 0, 'researched': 0, 'time': 0.0,
+                      'calibrated': 0, 'calibration_time': 0.0}
+
+    async def analyse(self, search, new_game):
+        """
+        search(depth=..., nodes=...) 为执行一次搜索的协程函数，返回info；
+        new_game() 为发送 ucinewgame 的协程函数（校准前调用）
+        返回最终结果的info，nodes 为所有搜索的节点数之和，depth 为最终搜索的深度
+        （所有worker协程运行在同一个事件循环中，统计无需加锁）
+        """
+        self.stats['positions'] += 1
+        calibrate = bool(self.calibrate_every) and self.stats['positions'] % self.calibrate_every == 0
+
+        start = time.time()
+        passes = [await search(**self.shallow), await search(depth=self.medium)]
+        shallow_eval = score_to_eval(passes[0])
+        medium_eval = score_to_eval(passes[1])
+        research = (shallow_eval is None or medium_eval is None
+                    or abs(shallow_eval - medium_eval) > self.threshold)
+
+        if research:
+            passes.append(await search(depth=self.deep))
+            self.stats['researched'] += 1
+        self.stats['time'] += time.time() - start
 
-        while time.time() - start_time < 60:  # 60秒超时
+        if calibrate:
+            await new_game()
+            calibration_start = time.time()
+            await search(depth=self.deep)
+            self.stats['calibration_time'] += time.time() - calibration_start
+            self.stats['calibrated'] += 1
+
+        info = passes[-1]
+        if info is not None:
+            info = dict(info, nodes=sum(p.get('nodes', 0) for p in passes if p))
+        return info
+
+    def report(self):
+        """打印重新深搜的比例和相对固定深度节省的引擎时间（估算）"""
+        stats = self.stats
+        positions = stats['positions']
+        if not positions:
+            return
+        print(f"Adaptive depth: {positions} positions, {stats['researched']} re-searched at depth "
+              f"{self.deep} ({stats['researched'] / positions:.1%}), engine time {stats['time']:.1f}s")
+        if stats['calibrated']:
+            fixed_time = stats['calibration_time'] / stats['calibrated'] * positions
+            print(f"  Estimated fixed depth {self.deep} time: {fixed_time:.1f}s "
+                  f"(from {stats['calibrated']} calibration positions), "
+                  f"saved {fixed_time - stats['time']:.1f}s")
+            print(f"  Calibration searches: {stats['calibration_time']:.1f}s "
+                  f"(from ucinewgame, not included in engine time)")
+        else:
+            print("  No calibration positions yet, engine time saved not estimated")
+
+
+class StockfishPool:
+    """
+    Stockfish引擎池: N个引擎在同一个asyncio事件循环（后台线程）中并发运行，
+    每个引擎由一个协程驱动，从共享队列领取对局的待评估位置，结果乱序返回后按提交顺序产出
+    单个引擎超时或退出时由 AsyncUciEngine 负责 stop/重启，不影响其他引擎
+    game_data['cached'] 中已有结果的位置（评估缓存命中）不再送入引擎
+    incremental=True 时每局先发送 ucinewgame，再沿主变体逐步发送 position ... moves ...，
+    否则每个位置单独发送 position fen
+    adaptive: AdaptiveDepth 策略，为None时每个位置按固定深度搜索
+    """
+
+    def __init__(self, workers=4, threads=1, hash_mb=16, stockfish_path=None, depth=None,
+                 incremental=False, adaptive=None, search_timeout=60):
+        self.num_workers = workers
+        self.incremental = incremental
+        self.adaptive = adaptive
+        self.engines = [
+            AsyncUciEngine(stockfish_path or DEFAULT_STOCKFISH_PATH, threads, hash_mb,
+                           depth or 15, search_timeout)
+            for _ in range(workers)
+        ]
+        self.loop = None
+        self.loop_thread = None
+        self.task_queue = None
+        self.result_queue = queue.Queue()
+        self.workers = []
+        self.stats = [{'positions': 0, 'busy': 0.0} for _ in range(workers)]
+        self.start_time = None
+
+    def _call(self, coro, timeout=None):
+        """在事件循环线程中运行协程并等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def start(self):
+        """启动事件循环线程、所有引擎和worker协程"""
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.start()
+
+        try:
+            self._call(self._start_engines())
+        except EngineError as e:
+            print(f"[ERROR] Failed to start Stockfish: {e}")
+            self.stop()
+            return False
+        print(f"[OK] Started {self.num_workers} Stockfish engines")
+
+        self.workers = [asyncio.run_coroutine_threadsafe(self._worker(worker_id, engine), self.loop)
+                        for worker_id, engine in enumerate(self.engines)]
+        self.start_time = time.time()
+        return True
+
+    async def _start_engines(self):
+        self.task_queue = asyncio.Queue()
+        await asyncio.gather(*(engine.start() for engine in self.engines))
+
+    async def _worker(self, worker_id, engine):
+        stats = self.stats[worker_id]
+        while True:
+            task = await self.task_queue.get()
+            if task is None:
+                break
+            seq, game_data = task
             try:
-                line = self.process.stdout.readline()
-                if line:
-                    line = line.strip()
-                    if line.startswith("info") and "score" in line:
-                        # 解析评估值
-                        eval_score = self.parse_evaluation(line)
-                        # 不立即返回，继续等待更深的结果
-                    elif line.startswith("bestmove"):
-                        # 分析完成
-                        break
+                start = time.time()
+                positions = game_data['positions']
+                cached = game_data.get('cached') or [None] * len(positions)
+                if self.incremental:
+                    await engine.new_game()
+                moves = game_data['moves']
+                evals = []
+                for (fen, _, _, _), info, ply in zip(positions, cached, game_data['plies']):
+                    if info is None:
+                        if self.incremental:
+                            command = position_command(root_fen=game_data['root_fen'], moves=moves[:ply])
+                        else:
+                            command = position_command(fen=fen)
+                        search = functools.partial(engine.analyse, command)
+                        if self.adaptive:
+                            info = await self.adaptive.analyse(search, engine.new_game)
+                        else:
+                            info = await search()
+                        stats['positions'] += 1
+                    evals.append(info)
+                stats['busy'] += time.time() - start
+                self.result_queue.put((seq, game_data, evals, None))
             except Exception as e:
-                print(f"[ERROR] Reading Stockfish output: {e}")
+                self.result_queue.put((seq, game_data, None, e))
+
+    def _submit(self, task):
+        self.loop.call_soon_threadsafe(self.task_queue.put_nowait, task)
+
+    def evaluate_games(self, game_iter, max_in_flight=None, stop_event=None):
+        """
+        评估一系列对局，按输入顺序产出 (game_data, evals)
+        evals 与 game_data['positions'] 一一对应，为引擎原始分数（见 StockfishEvaluator.analyse），
+        评估失败的位置为None
+        同时在途的对局数不超过 max_in_flight（默认 worker数 x 4）
+        stop_event 被设置后（如流水线关闭时）不再等待在途的对局，立即结束
+        """
+        max_in_flight = max_in_flight or self.num_workers * 4
+        game_iter = iter(game_iter)
+        done = {}
+        next_submit = 0
+        next_yield = 0
+        exhausted = False
+
+        while True:
+            while not exhausted and next_submit - next_yield < max_in_flight:
+                try:
+                    game_data = next(game_iter)
+                except StopIteration:
+                    exhausted = True
+                    break
+                self._submit((next_submit, game_data))
+                next_submit += 1
+
+            if next_yield == next_submit:
                 break
 
-        return eval_score
+            try:
+                result = self.result_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if stop_event is not None and stop_event.is_set():
+                    return
+                continue
+            seq, game_data, evals, error = result
+            if error is not None:
+                raise error
+            done[seq] = (game_data, evals)
+            while next_yield in done:
+                yield done.pop(next_yield)
+                next_yield += 1
 
-    def parse_evaluation(self, info_line):
-        """从Stockfish输出中解析评估值"""
+    def report(self):
+        """打印每个worker的吞吐量（位置/秒）以及引擎超时/重启次数"""
+        elapsed = time.time() - self.start_time if self.start_time else 0.0
+        total = sum(stats['positions'] for stats in self.stats)
+        print(f"Engine pool: {self.num_workers} workers, {total} positions in {elapsed:.1f}s "
+              f"({total / elapsed if elapsed else 0.0:.1f} positions/sec)")
+        for worker_id, (stats, engine) in enumerate(zip(self.stats, self.engines)):
+            rate = stats['positions'] / stats['busy'] if stats['busy'] else 0.0
+            print(f"  Worker {worker_id}: {stats['positions']} positions, "
+                  f"busy {stats['busy']:.1f}s, {rate:.2f} positions/sec, "
+                  f"{engine.timeouts} timeouts, {engine.restarts} restarts")
+        if self.adaptive:
+            self.adaptive.report()
+
+    def stop(self):
+        """停止worker协程、所有引擎和事件循环线程"""
+        if self.loop is None:
+            return
+        if self.workers:
+            for _ in self.workers:
+                self._submit(None)
+            # 中断时不无限等待正在评估的worker
+            concurrent.futures.wait(self.workers, timeout=5)
+            for worker in self.workers:
+                worker.cancel()
+            self.workers = []
         try:
-            # 示例: info depth 15 seldepth 29 score cp 50 ...
-            # 或: info depth 15 seldepth 29 score mate 3 ...
-            parts = info_line.split()
-
-            score_index = parts.index("score")
-            score_type = parts[score_index + 1]
-            score_value = int(parts[score_index + 2])
-
-            if score_type == "cp":
-                # centipawn评估，转换为-1到1范围
-                # 通常 +/-1000cp约为 +/-10分兵，对应 +/-1
-                eval_score = score_value / 1000.0
-                # 限制在-1到1之间
-                eval_score = max(-1.0, min(1.0, eval_score))
-                return eval_score
-            elif score_type == "mate":
-                # 将杀评估，转换为接近-1或1的值
-                if score_value > 0:
-                    return 0.9  # 白方即将获胜
-                else:
-                    return -0.9  # 黑方即将获胜
-        except:
+            self._call(self._quit_engines(), timeout=30)
+        except concurrent.futures.TimeoutError:
             pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
+        self.loop = None
+        print("[OK] Stockfish engines stopped")
 
-        return None
+    async def _quit_engines(self):
+        await asyncio.gather(*(engine.quit() for engine in self.engines), return_exceptions=True)
+
+
+RESULT_MAP = {'1-0': 1.0, '0-1': -1.0, '1/2-1/2': 0.0, '*': 0.0}
+
+
+class PositionVisitor(MainlineVisitor):
+    """
+    沿主变体边解析边提取待评估位置（不建立GameNode树，见 pgn_mainline）
+    result() 返回 game_data: positions 为 (fen, 走法UCI, 压缩位棋盘, Zobrist键)，
+    root_fen/moves 供按走法序列喂给引擎，plies/phases/quiet 与 positions 一一对应，供位置采样器使用，
+    evals 为每步走完之后注释中的 [%eval] 原始文本
+    """
+
+    def on_ply(self, board, move, ply):
+        return ((board.fen(), move.uci(), board_to_packed(board), position_key(board)),
+                game_phase(board, ply), is_quiet(board, move))
+
+    def result(self):
+        game = super().result()
+        return {
+            'offset': None,
+            'skipped': game['skipped'],
+            'result': RESULT_MAP.get(self.headers.get('Result', '*'), 0.0),
+            'root_fen': self.root_fen,
+            'positions': [record[0] for record in self.records],
+            'moves': self.moves,
+            'plies': list(range(len(self.records))),
+            'phases': [record[1] for record in self.records],
+            'quiet': [record[2] for record in self.records],
+            'evals': self.evals,
+        }
+
+
+def extract_game_positions(game, max_positions, offset=None):
+    """
+    提取已解析对局（GameNode树）主变体的前max_positions个位置（None表示全部），格式见 PositionVisitor
+    offset 为对局在PGN文件中的字节偏移（用于检查点）
+    """
+    game_data = game.accept(PositionVisitor(max_plies=max_positions))
+    game_data['offset'] = offset
+    return game_data
+
+
+def _extract_positions_shard(pgn_file, offsets, max_positions):
+    """子进程：解析一个分片内的对局并提取待评估位置"""
+    visitor = functools.partial(PositionVisitor, max_plies=max_positions)
+    games = []
+    for offset, game_data in zip(offsets, read_games_at(pgn_file, offsets, visitor)):
+        game_data['offset'] = offset
+        games.append(game_data)
+    return games
+
+
+def iter_game_positions(pgn_file, max_games=None, max_positions=50, variant_filter=None,
+                        use_index=False, index_filter=None, start_game=0, parse_workers=None,
+                        start_offset=0):
+    """
+    逐局产出待评估位置
+    parse_workers>1 时按索引切分文件，多进程并行解析和编码，按对局顺序合并
+    start_offset: 不使用索引时从该字节偏移开始读取
+    不使用索引时 game_data['next_offset'] 为下一局开始读取的字节偏移（检查点在对局写完后记录它）
+    """
+    if parse_workers and parse_workers > 1:
+        entries = select_entries(pgn_file, max_games, variant_filter, index_filter, start_game)
+        for games in map_game_shards(_extract_positions_shard, pgn_file, entries,
+                                     parse_workers, args=(max_positions,)):
+            yield from games
+        return
+
+    visitor = functools.partial(PositionVisitor, max_plies=max_positions)
+    for offset, next_offset, game_data in iter_pgn_games(
+            pgn_file, max_games, variant_filter, use_index=use_index, index_filter=index_filter,
+            start_game=start_game, start_offset=start_offset, with_offsets=True, visitor=visitor,
+            with_end_offsets=True):
+        game_data['offset'] = offset
+        game_data['next_offset'] = next_offset
+        yield game_data
+
+
+def _game_labels(game_data):
+    """已有的标注结果（与 positions 一一对应，未标注为None）"""
+    return game_data.get('cached') or [None] * len(game_data['positions'])
+
+
+def label_from_annotations(game_data):
+    """
+    用PGN注释中的 [%eval]（lichess导出，白方视角，包括 #将杀）标注位置，
+    第k个半回合的局面对应第k-1步走完之后的注释；
+    标注结果转换为当前走棋方视角（与引擎输出一致），写入 game_data['cached']，不再送入引擎
+    """
+    labels = list(_game_labels(game_data))
+    evals = game_data.get('evals') or []
+    for i, (position, ply) in enumerate(zip(game_data['positions'], game_data['plies'])):
+        if labels[i] is not None or not 0 < ply <= len(evals) or not evals[ply - 1]:
+            continue
+        info = parse_eval_annotation(evals[ply - 1])
+        if info is None:
+            continue
+        if not white_to_move(position[0]):
+            info['score'] = -info['score']
+        info['source'] = 'annotation'
+        labels[i] = info
+    game_data['cached'] = labels
+    return game_data
+
+
+def lookup_cached_evals(game_iter, cache, depth, batch_games=32):
+    """
+    为对局批量查询评估缓存，命中的结果写入 game_data['cached']（已由注释标注的位置不再查询）
+    每 batch_games 局合并成一次查询
+    """
+    batch = []
+    for game_data in game_iter:
+        batch.append(game_data)
+        if len(batch) >= batch_games:
+            yield from _apply_cached_evals(batch, cache, depth)
+            batch = []
+    yield from _apply_cached_evals(batch, cache, depth)
+
+
+def _apply_cached_evals(batch, cache, depth):
+    found = cache.get_many([position[3] for game_data in batch
+                            for position, label in zip(game_data['positions'], _game_labels(game_data))
+                            if label is None], depth)
+    for game_data in batch:
+        labels = []
+        for position, label in zip(game_data['positions'], _game_labels(game_data)):
+            if label is None and position[3] in found:
+                label = dict(found[position[3]], source='cache')
+            labels.append(label)
+        game_data['cached'] = labels
+    return batch
+
+
+DEFAULT_MODEL_PATH = os.path.join('models', 'chess_ai_model.keras')
+
+
+class ActiveLabeler:
+    """
+    主动标注: 用现有模型批量给待标注位置打分（估计模型在该位置的误差），
+    引擎预算优先花在模型最可能出错的位置上
+    mode='disagreement': 模型评估与浅搜索（shallow_depth，独立的小引擎池）之差的绝对值
+    mode='uncertainty': MC Dropout，dropout 保持开启重复前向 mc_samples 次，取预测的标准差（不需要引擎）
+    每 window 局为一组，按分数从高到低选出未标注位置中的前 fraction 送入引擎，其余跳过；
+    注释和缓存已标注的位置不参与排序，全部保留
+    budget: 整个任务送入引擎的位置数上限（None表示不限），用完后其余未标注位置全部跳过
+    模型需要 TensorFlow（只在使用主动标注时导入）
+    """
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, mode='disagreement', fraction=0.3, budget=None,
+                 window=64, shallow_depth=4, shallow_workers=1, mc_samples=8, batch_size=256, seed=42):
+        if mode not in ('disagreement', 'uncertainty'):
+            raise ValueError(f"Unknown active labeling mode: {mode}")
+        self.model_path = model_path
+        self.mode = mode
+        self.fraction = fraction
+        self.budget = budget
+        self.window = window
+        self.shallow_depth = shallow_depth
+        self.shallow_workers = shallow_workers
+        self.mc_samples = mc_samples
+        self.batch_size = batch_size
+        self.seed = seed
+        self.model = None
+        self.mc_layers = None
+        self.shallow_pool = None
+        self.used = 0
+        self.stats = {'candidates': 0, 'selected': 0, 'skipped': 0,
+                      'selected_score': 0.0, 'skipped_score': 0.0, 'time': 0.0}
+
+    def start(self, stockfish_path=None, threads=1, hash_mb=16):
+        """加载模型（disagreement 模式同时启动浅搜索引擎池）"""
+        from tensorflow import keras
+
+        keras.utils.set_random_seed(self.seed)
+        self.model = keras.models.load_model(self.model_path)
+        if self.mode == 'uncertainty':
+            # 逐层前向，Dropout 层保持开启，BatchNormalization 仍使用滑动统计（要求各层顺序连接）
+            self.mc_layers = [(layer, isinstance(layer, keras.layers.Dropout))
+                              for layer in self.model.layers[1:]]
+            if not any(dropout for _, dropout in self.mc_layers):
+                raise ValueError("uncertainty mode needs a model with Dropout layers")
+        print(f"[OK] Loaded model for active labeling: {self.model_path} ({self.mode})")
+
+        if self.mode == 'disagreement':
+            self.shallow_pool = StockfishPool(self.shallow_workers, threads, hash_mb, stockfish_path,
+                                              self.shallow_depth)
+            if not self.shallow_pool.start():
+                self.shallow_pool = None
+                return False
+        return True
+
+    def _predict(self, planes):
+        return self.model.predict(planes, batch_size=self.batch_size, verbose=0).reshape(-1)
+
+    def _predict_mc(self, planes):
+        outputs = []
+        for i in range(0, len(planes), self.batch_size):
+            x = planes[i:i + self.batch_size]
+            for layer, dropout in self.mc_layers:
+                x = layer(x, training=dropout)
+            outputs.append(np.asarray(x).reshape(-1))
+        return np.concatenate(outputs)
+
+    def score(self, games, candidates):
+        """
+        candidates: [(对局下标, 位置下标)]，返回每个候选位置的估计误差
+        """
+        packed = np.stack([games[g]['positions'][i][2] for g, i in candidates])
+        planes = unpack_bitboards(packed)
+        if self.mode == 'uncertainty':
+            predictions = np.stack([self._predict_mc(planes) for _ in range(self.mc_samples)])
+            return predictions.std(axis=0)
+
+        # 模型输出为白方视角、训练目标刻度，浅搜索结果（当前走棋方视角）换算到相同视角和刻度后比较
+        model_evals = self._predict(planes)
+        shallow = {}
+        for g, (_, evals) in enumerate(self.shallow_pool.evaluate_games(games)):
+            shallow[g] = evals
+        scores = np.empty(len(candidates), dtype=np.float32)
+        for n, (g, i) in enumerate(candidates):
+            shallow_eval = score_to_eval(shallow[g][i], white_to_move(games[g]['positions'][i][0]))
+            # 浅搜索失败的位置视为最不确定
+            if shallow_eval is None:
+                scores[n] = np.inf
+            else:
+                scores[n] = abs(model_evals[n] - eval_to_target(shallow_eval))
+        return scores
+
+    def select(self, games):
+        """对一组对局排序选择，返回只保留已标注位置和选中位置的 game_data"""
+        start = time.time()
+        candidates = [(g, i) for g, game_data in enumerate(games)
+                      for i, label in enumerate(_game_labels(game_data)) if label is None]
+        chosen = set()
+        if candidates:
+            remaining = None if self.budget is None else max(self.budget - self.used, 0)
+            count = -(-len(candidates) * self.fraction // 1)
+            count = int(count if remaining is None else min(count, remaining))
+            if count:
+                scores = self.score(games, candidates)
+                order = np.argsort(-scores, kind='stable')
+                chosen = {candidates[n] for n in order[:count]}
+                finite = np.where(np.isfinite(scores), scores, 0.0)
+                self.stats['selected_score'] += float(finite[order[:count]].sum())
+                self.stats['skipped_score'] += float(finite[order[count:]].sum())
+            self.used += len(chosen)
+            self.stats['candidates'] += len(candidates)
+            self.stats['selected'] += len(chosen)
+            self.stats['skipped'] += len(candidates) - len(chosen)
+        self.stats['time'] += time.time() - start
+
+        selected = []
+        for g, game_data in enumerate(games):
+            labels = _game_labels(game_data)
+            kept = [i for i, label in enumerate(labels) if label is not None or (g, i) in chosen]
+            sampled = dict(game_data)
+            for name in ('positions', 'plies', 'phases', 'quiet'):
+                sampled[name] = [game_data[name][i] for i in kept]
+            sampled['cached'] = [labels[i] for i in kept]
+            selected.append(sampled)
+        return selected
+
+    def apply(self, game_iter):
+        """按窗口逐组选择（生成器，对局顺序不变）"""
+        games = []
+        for game_data in game_iter:
+            games.append(game_data)
+            if len(games) >= self.window:
+                yield from self.select(games)
+                games = []
+        if games:
+            yield from self.select(games)
+
+    def report(self):
+        stats = self.stats
+        print(f"Active labeling ({self.mode}): {stats['candidates']} candidates scored, "
+              f"{stats['selected']} sent to engine, {stats['skipped']} skipped, "
+              f"{stats['time']:.1f}s scoring")
+        if stats['selected'] and stats['skipped']:
+            print(f"  Mean estimated error: selected {stats['selected_score'] / stats['selected']:.3f}, "
+                  f"skipped {stats['skipped_score'] / stats['skipped']:.3f}")
+        if self.budget is not None:
+            print(f"  Engine budget: {self.used} / {self.budget} positions")
+        if self.shallow_pool is not None:
+            print("  Shallow search:", end=' ')
+            self.shallow_pool.report()
 
     def stop(self):
-        """停止Stockfish进程"""
-        if self.process:
-            self.send_command("quit")
-            self.process.terminate()
-            self.process = None
-            print("[OK] Stockfish stopped")
+        if self.shallow_pool is not None:
+            self.shallow_pool.stop()
+            self.shallow_pool = None
+
+
+def encode_game(game_data, evals, packed=True):
+    """
+    把一局的标注结果编码成样本（评估值换算为白方视角），评估失败的位置跳过
+    返回 (samples, engine_evals)，engine_evals 为本局由引擎新得到的结果 [(key, info)]，用于写回评估缓存
+    """
+    samples = []
+    engine_evals = []
+    cached = _game_labels(game_data)
+    for (fen, move, board_bits, key), info, hit in zip(game_data['positions'], evals, cached):
+        if info is not None and hit is None:
+            engine_evals.append((key, info))
+        eval_score = score_to_eval(info, white_to_move(fen))
+        if eval_score is None:
+            continue
+        if packed:
+            sample = {'board_bits': [int(bits) for bits in board_bits]}
+        else:
+            sample = {'board_state': unpack_bitboards(board_bits)[0].tolist()}
+        sample.update({
+            'move': move,
+            'eval': float(eval_score),  # 白方视角的评估值
+            'result': float(game_data['result']),
+            'depth': int(info.get('depth', 0)),
+            'nodes': int(info.get('nodes', 0)) if hit is None else 0,
+            'source': hit['source'] if hit is not None else 'engine',
+        })
+        samples.append(sample)
+    return samples, engine_evals
+
+
+def process_pgn_file(pgn_file, output_file, max_games=None, max_positions_per_game=50,
+                     variant_filter=None, use_index=False, index_filter=None, start_game=0,
+                     parse_workers=None, packed=True, resume=False, checkpoint_every=10,
+                     engine_workers=1, engine_threads=1, engine_hash=16, stockfish_path=None,
+                     engine_depth=15, eval_cache=None, incremental=False, adaptive=None,
+                     engine_timeout=60, sampler=None, use_annotations=True, pipeline_queue=32,
+                     active=None):
+    """
+    处理PGN文件，为所有位置生成评估值
+    use_index=True 时通过边车索引按头信息（变体、等级分等）过滤后直接跳转读取，
+    被过滤掉的对局不再解析走法；start_game 可从过滤结果的第N局继续
+    parse_workers>1 时多进程并行解析PGN（Stockfish评估仍在主进程中进行）
+    packed=True 时样本棋盘保存为12个uint64位棋盘(board_bits)，否则为8x8x12张量(board_state)
+    output_file 以 .json 结尾时写JSON，否则写二进制分片数据集目录（见 dataset_io），
+    样本评估完成后立即写入，不在内存中累积
 
+    检查点: 每处理 checkpoint_every 局（以及Ctrl-C中断时）把
+    (已完成对局数, 下一局的字节偏移, 已评估位置数, 输出写入位置) 保存到 <output>.ckpt，
+    resume=True 时从检查点继续，已评估的位置不会重复计算；全部完成后删除检查点
 
-def process_pgn_file(pgn_file, output_file, max_games=None, max_positions_per_game=50):
-    """处理PGN文件，为所有位置生成评估值"""
+    engine_workers: 并行的Stockfish进程数，每个进程使用 engine_threads 线程和 engine_hash MB置换表，
+    结束时打印每个worker的吞吐量，便于调整进程数与线程数的分配
+    incremental=True 时按对局走法序列喂给引擎（每局 ucinewgame），连续半回合可以复用置换表，
+    见 benchmark_feed_modes
+    adaptive: AdaptiveDepth 策略（浅/中搜索不一致时才深搜），为None时固定 engine_depth；
+    每个样本记录实际使用的搜索深度(depth)和节点数(nodes)，缓存命中的样本 nodes 为0
+    engine_timeout: 单个位置的最长搜索时间（秒），超时发送 stop，引擎无响应时自动重启
+    sampler: PositionSampler，在解析和标注之间过滤位置（跳过开局、去重、按阶段采样等），
+    此时 max_positions_per_game 为每局采样后的上限；去重集合保存在 <output>.seen，随检查点继续
+    use_annotations: 带有 [%eval] 注释的位置直接用注释标注（其次查评估缓存），只有其余位置送入引擎；
+    每个样本记录评估值来源 source（engine/cache/annotation）
+    评估值统一为白方视角（引擎输出的当前走棋方分数在写入前换算）
+
+    eval_cache: 评估缓存文件路径（见 eval_cache），为None时不使用缓存；
+    深度不低于 engine_depth 的缓存结果直接复用，新的评估结果写回缓存，可跨运行、跨PGN文件共享
+
+    pgn_file 可以是压缩文件（.gz/.bz2/.xz/.zst，见 pgn_io），此时顺序流式解压读取，
+    不使用索引和多进程解析，继续处理时按对局数跳过
+
+    active: ActiveLabeler，用现有模型给未标注位置打分，只把估计误差最大的位置送入引擎，
+    其余跳过；预算的使用量随检查点保存
+
+    处理过程是分阶段流水线（见 pipeline）: 解析 -> 过滤（采样/注释/缓存）-> 引擎标注 -> 编码 -> 写入，
+    各阶段在独立线程中运行，阶段之间是长度为 pipeline_queue 局的有界队列，
+    解析和编码与引擎搜索同时进行；结束时打印各阶段的吞吐量、等待时间和队列占用率
+    """
     print(f"\nProcessing PGN file: {pgn_file}")
     print(f"Output file: {output_file}")
     print(f"Max games: {max_games or 'all'}")
     print(f"Max positions per game: {max_positions_per_game}")
     print()
 
-    # 初始化Stockfish
-    evaluator = StockfishEvaluator()
-    if not evaluator.start():
+    compressed = is_compressed(pgn_file)
+    if compressed and (use_index or (parse_workers and parse_workers > 1)):
+        print("[WARN] Compressed PGN: index and parallel parsing disabled, reading sequentially")
+        use_index = False
+        parse_workers = None
+
+    checkpoint_file = output_file.rstrip('/\\') + '.ckpt'
+    checkpoint = None
+    if resume and os.path.exists(checkpoint_file):
+        with open(checkpoint_file, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        print(f"Resuming from checkpoint: {checkpoint['games_done']} games, "
+              f"{checkpoint['positions_done']} positions already evaluated")
+        print()
+
+    # 初始化Stockfish引擎池
+    pool = StockfishPool(engine_workers, engine_threads, engine_hash, stockfish_path, engine_depth,
+                         incremental, adaptive, engine_timeout)
+    if not pool.start():
         print("[ERROR] Failed to start Stockfish. Please install Stockfish first.")
         print("\nInstallation instructions:")
         print("1. Download from: https://stockfishchess.org/download")
         print("2. Extract to a folder")
         print("3. Add to PATH or specify path in script")
         return
+    if active is not None and not active.start(stockfish_path, engine_threads, engine_hash):
+        pool.stop()
+        return
 
-    # 读取PGN文件
-    with open(pgn_file, 'r', encoding='utf-8') as f:
-        games_processed = 0
-        positions_processed = 0
-        all_samples = []
+    # 读取PGN文件（从检查点继续时跳过已完成的对局）
+    games_processed = 0
+    positions_processed = 0
+    start_offset = 0
+    if checkpoint:
+        games_processed = checkpoint['games_done']
+        positions_processed = checkpoint['positions_done']
+        if active is not None:
+            active.used = checkpoint.get('engine_positions', 0)
+        if use_index or (parse_workers and parse_workers > 1) or compressed:
+            start_game += games_processed
+        else:
+            start_offset = checkpoint['game_offset']
+            start_game = 0
 
-        while True:
-            game = chess.pgn.read_game(f)
-            if game is None:
-                break
+    def save_checkpoint(boundary):
+        state = dict(boundary, pgn_file=pgn_file)
+        tmp_file = checkpoint_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_file, checkpoint_file)
 
-            if max_games and games_processed >= max_games:
-                break
+    writer = seen_log = cache = lookup_cache = None
+    new_evals = []
+    boundary = None
+    pipeline = Pipeline(pipeline_queue)
+    try:
+        writer = create_writer(output_file, checkpoint and checkpoint['writer'])
+        if sampler is not None and sampler.dedupe:
+            seen_log = SeenKeyLog(output_file.rstrip('/\\') + '.seen',
+                                  checkpoint.get('seen_keys') if checkpoint else None)
+            sampler.seen.update(seen_log.load())
+        cache = EvalCache(eval_cache) if eval_cache else None
+        # 过滤阶段在自己的线程中查询缓存，使用单独的连接（写回仍在主线程中进行）
+        lookup_cache = EvalCache(eval_cache, check_same_thread=False) if eval_cache else None
+
+        remaining_games = max_games - games_processed if max_games else None
+        if remaining_games is not None and remaining_games <= 0:
+            game_iter = pipeline.stage('parse', [])
+        else:
+            game_iter = pipeline.stage('parse', iter_game_positions(
+                pgn_file, remaining_games, None if sampler else max_positions_per_game,
+                variant_filter, use_index, index_filter, start_game, parse_workers, start_offset))
+            filtered = game_iter
+            if sampler is not None:
+                filtered = sampler.apply(filtered, max_positions_per_game)
+            if use_annotations:
+                filtered = map(label_from_annotations, filtered)
+            if lookup_cache is not None:
+                # 自适应深度的结果至少是中等深度
+                filtered = lookup_cached_evals(filtered, lookup_cache,
+                                               adaptive.medium if adaptive else engine_depth)
+            if filtered is not game_iter:
+                game_iter = pipeline.stage('filter', filtered)
+            if active is not None:
+                game_iter = pipeline.stage('select', active.apply(game_iter))
+        # 流水线关闭时标注阶段不再等待在途的对局
+        labelled = pipeline.stage('label', pool.evaluate_games(game_iter,
+                                                               stop_event=pipeline.stop_event))
+        encoded = pipeline.stage('encode', ((game_data, *encode_game(game_data, evals, packed))
+                                            for game_data, evals in labelled))
+
+        games_this_run = 0
+        label_sources = {'engine': 0, 'cache': 0, 'annotation': 0}
+        engine_positions = checkpoint.get('engine_positions', 0) if checkpoint else 0
+        for game_data, samples, engine_evals in pipeline.consume('write', encoded):
+            if cache is not None:
+                # 按实际完成的深度写入缓存（超时的搜索只完成了较浅的深度）
+                new_evals.extend((key, info.get('depth', 0), info) for key, info in engine_evals)
+            # 保存样本
+            for sample in samples:
+                label_sources[sample['source']] += 1
+                sample['game'] = games_processed
+                writer.write(sample)
+            positions_in_game = len(samples)
 
-            # 提取位置和走法
-            board = game.board()
-            node = game
-            game_samples = []
-            positions_in_game = 0
-
-            while node.variations and positions_in_game < max_positions_per_game:
-                node = node.variations[0]  # 主变体
-
-                # 评估当前位置
-                fen = board.fen()
-                eval_score = evaluator.evaluate_position(fen)
-
-                if eval_score is not None:
-                    # 将棋盘转换为张量
-                    board_tensor = board_to_tensor(board)
-
-                    # 获取对局结果
-                    result = game.headers.get('Result', '*')
-                    result_map = {'1-0': 1.0, '0-1': -1.0, '1/2-1/2': 0.0, '*': 0.0}
-                    game_result = result_map.get(result, 0.0)
-
-                    # 保存样本
-                    sample = {
-                        'board_state': board_tensor.tolist(),
-                        'move': node.move.uci(),
-                        'eval': float(eval_score),  # 使用Stockfish评估
-                        'result': float(game_result)
-                    }
-                    game_samples.append(sample)
-                    positions_in_game += 1
-
-                # 推进棋盘
-                board.push(node.move)
-
-            all_samples.extend(game_samples)
+            if seen_log is not None:
+                seen_log.append([position[3] for position in game_data['positions']])
             games_processed += 1
+            games_this_run += 1
             positions_processed += positions_in_game
 
+            # 对局边界（本局已写完）：记录 (已完成对局数, 下一局字节偏移, 已评估位置数, 写入位置)，
+            # 中断时保存它，已写完的对局不会重新评估；每 checkpoint_every 局落盘并保存检查点
+            save = games_this_run % checkpoint_every == 0
+            boundary = {
+                'games_done': games_processed,
+                'game_offset': game_data.get('next_offset'),
+                'positions_done': positions_processed,
+                'engine_positions': engine_positions + label_sources['engine'],
+                'writer': writer.checkpoint() if save else writer.state(),
+            }
+            if seen_log is not None:
+                boundary['seen_keys'] = seen_log.count
+            if save:
+                if cache is not None:
+                    cache.put_many(new_evals)
+                    new_evals = []
+                if seen_log is not None:
+                    seen_log.flush()
+                save_checkpoint(boundary)
+
             # 进度报告
             if games_processed % 10 == 0:
                 print(f"Processed {games_processed} games, {positions_processed} positions...")
+    except BaseException as e:
+        # 中断或出错: 保存最后一局写完之后的状态，流水线中尚未写入的对局下次重新评估；
+        # 无论如何都关闭写入器和评估缓存并停止引擎
+        pipeline.close()
+        try:
+            if writer is not None:
+                writer.close()
+            if boundary is not None:
+                save_checkpoint(boundary)
+            if cache is not None:
+                cache.put_many(new_evals)
+        finally:
+            if cache is not None:
+                cache.close()
+            if lookup_cache is not None:
+                lookup_cache.close()
+            if seen_log is not None:
+                seen_log.close()
+            if active is not None:
+                active.stop()
+            pool.stop()
+        if not isinstance(e, KeyboardInterrupt):
+            raise
+        print(f"\n[WARN] Interrupted. Progress saved to {checkpoint_file}, "
+              f"run again with resume=True to continue")
+        return
 
     # 保存结果
-    print(f"\nSaving {len(all_samples)} samples to {output_file}...")
-
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(all_samples, f, indent=2)
+    pipeline.close()
+    writer.close()
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    if seen_log is not None:
+        seen_log.remove()
 
-    print(f"[OK] Saved {len(all_samples)} samples")
+    print(f"[OK] Saved {writer.count} samples to {output_file}")
     print(f"  Games processed: {games_processed}")
     print(f"  Positions evaluated: {positions_processed}")
+    print(f"  Labels this run: {label_sources['engine']} engine, {label_sources['cache']} cache, "
+          f"{label_sources['annotation']} annotation")
+    if cache is not None:
+        cache.put_many(new_evals)
+        print(f"  Eval cache: {lookup_cache.hits} hits, {lookup_cache.misses} misses, "
+              f"{len(cache)} positions in {eval_cache}")
+        cache.close()
+        lookup_cache.close()
+    if sampler is not None:
+        sampler.report()
+    if active is not None:
+        active.report()
+        active.stop()
+    pool.report()
+    pipeline.report()
 
     # 停止Stockfish
-    evaluator.stop()
+    pool.stop()
 
 
-def board_to_tensor(board):
-    """将棋盘状态转换为8x8x12的张量"""
-    import numpy as np
+def benchmark_feed_modes(pgn_file, max_games=20, max_positions_per_game=50, depth=12,
+                         threads=1, hash_mb=16, stockfish_path=None):
+    """
+    比较两种喂位置方式在相同深度下的吞吐量（位置/秒）:
+    逐个 position fen，与每局 ucinewgame 后沿走法序列 position startpos moves ...
+    """
+    games = list(iter_game_positions(pgn_file, max_games, max_positions_per_game))
+    total = sum(len(game_data['positions']) for game_data in games)
+    print(f"Benchmark: {len(games)} games, {total} positions, depth {depth}, "
+          f"Threads {threads}, Hash {hash_mb}MB")
 
-    tensor = np.zeros((8, 8, 12), dtype=np.float32)
-
-    piece_to_index = {
-        'P': 0, 'N': 1, 'B': 2, 'R': 3, 'Q': 4, 'K': 5,
-        'p': 6, 'n': 7, 'b': 8, 'r': 9, 'q': 10, 'k': 11
-    }
-
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if piece:
-            row = square // 8
-            col = square % 8
-            piece_char = piece.symbol()
-            tensor[row, col, piece_to_index[piece_char]] = 1.0
+    rates = {}
+    for mode, incremental in (('fen', False), ('moves', True)):
+        pool = StockfishPool(1, threads, hash_mb, stockfish_path, depth, incremental)
+        if not pool.start():
+            return None
+        start_time = time.time()
+        for _ in pool.evaluate_games(games):
+            pass
+        elapsed = time.time() - start_time
+        pool.stop()
+        rates[mode] = total / elapsed if elapsed else 0.0
+        print(f"  {mode:5s}: {elapsed:.1f}s, {rates[mode]:.1f} positions/sec")
 
-    return tensor
+    if rates['fen']:
+        print(f"  Speedup (moves vs fen): {rates['moves'] / rates['fen']:.2f}x")
+    return rates
 
 
 def main():
@@ -258,27 +1003,37 @@ def main():
 
     # 配置
     pgn_file = "lichess_tournament_2025.12.31_C5W0R90y_hourly-ultrabullet.pgn"
-    output_file = "chess_training_data_with_eval.json"
+    output_file = "chess_training_data_with_eval"  # 二进制分片数据集目录
 
     # 检查文件是否存在
     if not os.path.exists(pgn_file):
         print(f"[ERROR] PGN file not found: {pgn_file}")
         return
 
+    # python generate_evaluations.py benchmark: 比较两种喂位置方式的速度
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        benchmark_feed_modes(pgn_file)
+        return
+
     # 处理PGN文件
     # 注意：评估所有位置会很慢，建议先用少量游戏测试
     process_pgn_file(
         pgn_file,
         output_file,
         max_games=500,  # 处理所有500局对局
-        max_positions_per_game=50  # 每局最多50个位置
+        max_positions_per_game=50,  # 每局最多50个位置
+        sampler=PositionSampler(skip_plies=8, mode='uniform'),  # 跳过开局、全局去重后每局均匀采样
+        resume=True,  # 中断后重新运行会从检查点继续
+        incremental=True,  # 沿对局走法喂给引擎，复用置换表
+        eval_cache="stockfish_eval_cache.sqlite",  # 评估缓存，跨运行复用已评估的局面
+        adaptive=None  # 设为 AdaptiveDepth() 时先浅搜索，结果不一致才深搜
     )
 
     print("\n" + "=" * 80)
     print("Evaluation generation complete!")
     print("=" * 80)
     print("\nNext steps:")
-    print("1. Review the generated data: chess_training_data_with_eval.json")
+    print("1. Review the generated data: python check_data.py")
     print("2. Train the model with: python train_model.py")
     print("3. Test the model with: python test_model.py")
 
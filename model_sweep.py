@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+模型结构对比 - 训练 train_model.MODEL_VARIANTS 中的各个结构变体，
+转换为TFLite（int8量化，未通过精度检查时为float32，与部署到固件的模型相同）后测量:
+    参数量、FLOPs（卷积和全连接层的乘加数 x2，BatchNormalization在转换时被折叠，不计入）、
+    TFLite模型大小、主机端逐个局面的推理延迟、验证集平均绝对误差
+并给出 延迟/精度 的帕累托前沿: 没有其他变体同时更快且误差更小的变体
+更便宜的模型可以让固件在同样的 bestmove 时间预算内搜索更深
+
+默认以FLOPs作为延迟的度量: 主机端的小模型推理时间主要是解释器每次调用的固定开销，
+不能反映ESP32上以计算为主的延迟；cost='latency_ms' 时改用主机端实测延迟
+
+用法: python model_sweep.py [数据集] [变体1,变体2,...]
+"""
+
+import json
+import os
+import sys
+
+from tensorflow import keras
+from tensorflow.keras import layers
+
+from dataset_io import is_shard_dataset
+from train_model import MODEL_VARIANTS, ChessModelTrainer
+
+
+def count_flops(model):
+    """单个局面前向计算的浮点运算数（乘加各算一次）"""
+    flops = 0
+    for layer in model.layers:
+        if isinstance(layer, layers.SeparableConv2D):
+            _, height, width, filters = layer.output.shape
+            in_channels = layer.input.shape[-1]
+            kernel = layer.kernel_size[0] * layer.kernel_size[1]
+            flops += 2 * height * width * (kernel * in_channels + in_channels * filters)
+        elif isinstance(layer, layers.Conv2D):
+            _, height, width, filters = layer.output.shape
+            in_channels = layer.input.shape[-1]
+            kernel = layer.kernel_size[0] * layer.kernel_size[1]
+            flops += 2 * height * width * kernel * in_channels * filters
+        elif isinstance(layer, layers.Dense):
+            flops += 2 * layer.input.shape[-1] * layer.units
+    return flops
+
+
+def pareto_front(results, cost='flops'):
+    """返回不被支配的变体名称（cost 和MAE都不更差、且至少一项更好的变体支配另一个）"""
+    front = set()
+    for name, result in results.items():
+        dominated = any(
+            other[cost] <= result[cost] and other['mae'] <= result['mae']
+            and (other[cost] < result[cost] or other['mae'] < result['mae'])
+            for other_name, other in results.items() if other_name != name)
+        if not dominated:
+            front.add(name)
+    return front
+
+
+def run_sweep(data_file, variants=None, output_dir=os.path.join('models', 'variants'), epochs=30,
+              batch_size=128, max_samples=50000, augment=True, cost='flops'):
+    """
+    依次训练、转换并测量每个变体（模型保存在 output_dir/<变体名>/），
+    返回 {变体名: 测量结果}，同时写入 output_dir/pareto_report.json
+    """
+    variants = variants or list(MODEL_VARIANTS)
+    streaming = is_shard_dataset(data_file)
+    results = {}
+
+    for name in variants:
+        print("\n" + "=" * 60)
+        print(f"模型变体: {name} {MODEL_VARIANTS[name]}")
+        print("=" * 60)
+        keras.backend.clear_session()
+
+        trainer = ChessModelTrainer(data_file, os.path.join(output_dir, name), variant=name)
+        model, _ = trainer.train(epochs=epochs, batch_size=batch_size, max_samples=max_samples,
+                                 streaming=streaming, augment=augment)
+        trainer.convert_to_tflite(os.path.join(trainer.model_dir, 'chess_ai_model.keras'),
+                                  quantize=True, max_samples=max_samples)
+
+        stats = trainer.quantization_stats
+        deployed = stats[stats['selected']]
+        results[name] = {
+            'params': model.count_params(),
+            'flops': count_flops(model),
+            'tflite_type': stats['selected'],
+            'tflite_size': deployed['size'],
+            'latency_ms': deployed['latency_ms'],
+            'mae': deployed['mae'],
+            'float32_mae': stats['float32']['mae'],
+        }
+
+    front = pareto_front(results, cost)
+    for name, result in results.items():
+        result['pareto'] = name in front
+
+    report_path = os.path.join(output_dir, 'pareto_report.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print_report(results, cost)
+    print(f"\n报告已保存到: {report_path}")
+    return results
+
+
+def print_report(results, cost='flops'):
+    """按 cost 排序打印各变体的测量结果，* 标记帕累托前沿上的变体"""
+    baseline = results.get('baseline')
+    print("\n" + "=" * 60)
+    print(f"延迟/精度对比（按 {cost} 排序，* 为帕累托前沿）")
+    print("=" * 60)
+    print(f"  {'变体':16s} {'参数量':>9s} {'MFLOPs':>8s} {'相对计算量':>8s} {'TFLite':>17s} "
+          f"{'延迟':>9s} {'MAE':>8s}")
+    for name, result in sorted(results.items(), key=lambda item: item[1][cost]):
+        relative = f"{result['flops'] / baseline['flops']:.2f}x" if baseline else '-'
+        print(f"{'*' if result['pareto'] else ' '} {name:16s} {result['params']:9d} "
+              f"{result['flops'] / 1e6:8.2f} {relative:>8s} "
+              f"{result['tflite_size'] / 1024:7.1f}KB {result['tflite_type']:>7s} "
+              f"{result['latency_ms']:7.3f}ms {result['mae']:8.4f}")
+
+
+def main():
+    # 配置
+    data_file = sys.argv[1] if len(sys.argv) > 1 else "chess_training_data_with_eval"
+    variants = sys.argv[2].split(',') if len(sys.argv) > 2 else None
+
+    unknown = [name for name in variants or () if name not in MODEL_VARIANTS]
+    if unknown:
+        print(f"未知的模型变体: {', '.join(unknown)}（可选: {', '.join(MODEL_VARIANTS)}）")
+        return
+
+    run_sweep(data_file, variants)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,118 +4,323 @@ PGN数据解析器 - 为ESP32国际象棋AI准备训练数据
 """
 
 import chess.pgn
-import numpy as np
+import functools
 import json
+import os
+import random
 from pathlib import Path
 
+from board_encoder import board_to_packed, board_to_tensor
+from dataset_io import JsonSampleWriter, ShardWriter
+from pgn_io import is_compressed, open_pgn
+from pgn_index import iter_pgn_games, map_game_shards, read_games_at, select_entries
+from pgn_mainline import MainlineVisitor
+from position_sampler import PHASES, Reservoir, StratifiedReservoir, game_phase
+
+RESULT_MAP = {'1-0': 1.0, '0-1': -1.0, '1/2-1/2': 0.0, '*': 0.0}
+
+# 分层蓄水池抽样的默认分层（各层等比例）
+STRATA = {
+    'phase': PHASES,
+    'result': ('1-0', '0-1', '1/2-1/2'),
+}
+
+
+class SampleVisitor(MainlineVisitor):
+    """
+    沿主变体边解析边生成训练样本（不建立GameNode树，见 pgn_mainline）
+    样本的评估值取该步走完之后注释中的 [%eval]（没有或无法解析时为0）
+    """
+
+    def __init__(self, variant_filter=None, max_plies=None, packed=True):
+        super().__init__(variant_filter, max_plies)
+        self.packed = packed
+
+    def on_ply(self, board, move, ply):
+        sample = {'move': move.uci()}
+        # 提取棋盘状态（压缩的位棋盘，或8x8x12的one-hot编码）
+        if self.packed:
+            sample['board_bits'] = board_to_packed(board)
+        else:
+            sample['board_state'] = board_to_tensor(board)
+        return sample
+
+    def result(self):
+        game = super().result()
+        game_result = RESULT_MAP.get(self.headers.get('Result', '*'), 0.0)
+        for sample, eval_text in zip(self.records, self.evals):
+            if sample is None:
+                continue
+            eval_score = 0.0
+            if eval_text:
+                try:
+                    eval_score = float(eval_text)
+                except ValueError:
+                    pass
+            sample['eval'] = eval_score
+            sample['result'] = game_result
+        return game
+
+
+class ReservoirVisitor(SampleVisitor):
+    """
+    蓄水池抽样模式: 每个半回合先向蓄水池登记，只有入选的位置才编码成样本，
+    未入选的半回合在 records 中为None
+    stratify: None、'phase'（对局阶段）或 'result'（对局结果），见 STRATA
+    """
+
+    def __init__(self, reservoir, stratify=None, variant_filter=None, max_plies=None, packed=True):
+        super().__init__(variant_filter, max_plies, packed)
+        self.reservoir = reservoir
+        self.stratify = stratify
+
+    def _stratum(self, board, ply):
+        if self.stratify == 'phase':
+            return game_phase(board, ply)
+        if self.stratify == 'result':
+            return self.headers.get('Result', '*')
+        return 'all'
+
+    def on_ply(self, board, move, ply):
+        key = self.reservoir.offer(self._stratum(board, ply))
+        if key is None:
+            return None
+        # 样本字典在 result() 中补上 eval/result，蓄水池保存的是同一个对象
+        sample = super().on_ply(board, move, ply)
+        self.reservoir.put(key, sample)
+        return sample
+
+
+class _SampledGameBuilder(chess.pgn.GameBuilder):
+    """对局级蓄水池抽样: 读完头信息后登记，未入选的对局跳过走法文本不解析"""
+
+    def __init__(self, reservoir, variant_filter=None):
+        super().__init__()
+        self.reservoir = reservoir
+        self.variant_filter = variant_filter
+
+    def end_headers(self):
+        self.slot = None
+        if self.variant_filter and self.game.headers.get('Variant', 'Standard') != self.variant_filter:
+            return chess.pgn.SKIP
+        self.slot = self.reservoir.offer()
+        return chess.pgn.SKIP if self.slot is None else None
+
+    def result(self):
+        return self.slot, super().result()
+
 
 class ChessDataExtractor:
-    def __init__(self, pgn_file):
+    def __init__(self, pgn_file, use_index=False, index_filter=None, start_game=0, packed=True):
+        """
+        use_index: 使用边车索引(<pgn>.idx)按头信息过滤并直接跳转到对局
+        index_filter: 传给 PgnGameIndex.filter 的额外条件（如 min_elo, min_plies）
+        start_game: 跳过过滤结果中的前N局
+        packed: 样本中的棋盘保存为12个uint64位棋盘(board_bits)，否则为8x8x12张量(board_state)
+        """
         self.pgn_file = pgn_file
+        self.packed = packed
+        # 压缩的PGN（见 pgn_io）只能顺序读取，不能使用索引和多进程分片
+        self.compressed = is_compressed(pgn_file)
+        if self.compressed and use_index:
+            print("压缩的PGN文件不支持索引，改为顺序读取")
+            use_index = False
+        self.use_index = use_index
+        self.index_filter = index_filter
+        self.start_game = start_game
         self.games = []
 
-    def parse_pgn(self, max_games=None, variant_filter=None):
-        """解析PGN文件，提取对局数据"""
-        with open(self.pgn_file, 'r', encoding='utf-8') as f:
-            while True:
-                game = chess.pgn.read_game(f)
-                if game is None:
-                    break
-
-                # 过滤变体
-                if variant_filter:
-                    headers = game.headers
-                    variant = headers.get('Variant', 'Standard')
-                    if variant != variant_filter:
-                        continue
+    def iter_games(self, max_games=None, variant_filter=None):
+        """
+        逐局读取PGN文件（生成器）
+        每次只在内存中保留当前对局，适合数GB的lichess月度数据
+        """
+        return iter_pgn_games(self.pgn_file, max_games, variant_filter,
+                              use_index=self.use_index,
+                              index_filter=self.index_filter,
+                              start_game=self.start_game)
 
+    def parse_pgn(self, max_games=None, variant_filter=None, sampling='first', seed=42):
+        """
+        解析PGN文件，提取对局数据
+        sampling='first' 取文件中最前面的 max_games 局；
+        'reservoir' 从整个文件中等概率抽取 max_games 局（单遍读取，见 sample_games）
+        """
+        if sampling == 'reservoir':
+            self.games.extend(self.sample_games(max_games, variant_filter, seed))
+        elif sampling == 'first':
+            for game in self.iter_games(max_games, variant_filter):
                 self.games.append(game)
-                if max_games and len(self.games) >= max_games:
-                    break
+        else:
+            raise ValueError(f"未知的抽样方式: {sampling}")
 
         print(f"成功解析 {len(self.games)} 局对局")
         return self.games
 
-    def extract_training_samples(self, game, max_samples_per_game=100):
+    def iter_samples(self, max_games=None, variant_filter=None,
+                     max_samples=None, max_samples_per_game=100):
         """
-        从单个对局中提取训练样本
-        返回: (board_state, move, eval_score, result)
+        流式模式：边解析边产出编码后的训练样本
+        不保存对局到self.games，达到max_samples后立即停止读取文件
         """
-        samples = []
-        board = game.board()
-        node = game
-
-        # 获取对局结果
-        result = game.headers.get('Result', '*')
-        result_map = {'1-0': 1.0, '0-1': -1.0, '1/2-1/2': 0.0, '*': 0.0}
-        game_result = result_map.get(result, 0.0)
-
+        visitor = functools.partial(SampleVisitor, max_plies=max_samples_per_game, packed=self.packed)
         sample_count = 0
-        while node.variations and sample_count < max_samples_per_game:
-            node = node.variations[0]  # 获取主变体
-            move = node.move
+        games = iter_pgn_games(self.pgn_file, max_games, variant_filter,
+                               use_index=self.use_index,
+                               index_filter=self.index_filter,
+                               start_game=self.start_game,
+                               visitor=visitor)
+        for game_number, game in enumerate(games, self.start_game):
+            for sample in game['records']:
+                sample['game'] = game_number
+                yield sample
+                sample_count += 1
+                if max_samples and sample_count >= max_samples:
+                    return
+
+    def sample_games(self, sample_size, variant_filter=None, seed=42):
+        """
+        从整个PGN文件中等概率抽取 sample_size 局（按文件顺序返回）
+        使用索引时直接从过滤结果中抽取偏移；否则单遍蓄水池抽样，
+        未入选的对局只读头信息，内存只与 sample_size 有关
+        """
+        if not sample_size:
+            raise ValueError("蓄水池抽样需要指定抽取的对局数")
+        rng = random.Random(seed)
+
+        if self.use_index:
+            entries = select_entries(self.pgn_file, None, variant_filter,
+                                     self.index_filter, self.start_game)
+            chosen = sorted(rng.sample(range(len(entries)), min(sample_size, len(entries))))
+            return list(read_games_at(self.pgn_file, [entries[i]['offset'] for i in chosen]))
+
+        reservoir = Reservoir(sample_size, rng)
+        visitor = functools.partial(_SampledGameBuilder, reservoir, variant_filter)
+        with open_pgn(self.pgn_file) as f:
+            skipped = 0
+            while skipped < self.start_game:
+                headers = chess.pgn.read_headers(f)
+                if headers is None:
+                    break
+                if not variant_filter or headers.get('Variant', 'Standard') == variant_filter:
+                    skipped += 1
 
-            # 获取评估值（如果有）
-            eval_score = 0.0
-            if node.comment:
-                # 尝试从注释中提取评估值
-                comment = node.comment
-                if '[%eval' in comment:
-                    try:
-                        eval_str = comment.split('[%eval')[1].split(']')[0].strip()
-                        eval_score = float(eval_str)
-                    except:
-                        pass
-
-            # 提取棋盘状态（8x8x12的one-hot编码）
-            board_state = self.board_to_tensor(board)
-
-            # 将走法转换为索引
-            move_index = self.move_to_index(move, board)
-
-            samples.append({
-                'board_state': board_state,
-                'move': move_index,
-                'eval': eval_score,
-                'result': game_result
-            })
-
-            board.push(move)
-            sample_count += 1
+            while True:
+                result = chess.pgn.read_game(f, Visitor=visitor)
+                if result is None:
+                    break
+                slot, game = result
+                if slot is not None:
+                    # 记录读取顺序，最后按文件顺序返回
+                    reservoir.items[slot] = (reservoir.seen, game)
+
+        print(f"从 {reservoir.seen} 局对局中抽取了 {len(reservoir.items)} 局")
+        return [game for _, game in sorted(reservoir.items, key=lambda item: item[0])]
 
+    def reservoir_samples(self, sample_size, max_games=None, variant_filter=None,
+                          max_samples_per_game=None, stratify=None, strata_weights=None, seed=42):
+        """
+        单遍蓄水池抽样: 从任意大的PGN流中等概率抽取 sample_size 个位置（结果随机打乱）
+        内存只与 sample_size 有关，未入选的位置不编码
+        stratify: None、'phase' 或 'result'，分层时各层按 strata_weights 比例
+        （默认各层相等）分配名额，每层内部等概率抽取；某层位置不足时全部保留，
+        此时总样本数少于 sample_size
+        max_samples_per_game: 每局只考虑前N个半回合（None表示全部，位置等概率）
+        """
+        if not sample_size:
+            raise ValueError("蓄水池抽样需要指定样本数")
+        if stratify is not None and stratify not in STRATA:
+            raise ValueError(f"未知的分层方式: {stratify}")
+
+        weights = strata_weights or {'all': 1.0}
+        if stratify:
+            weights = strata_weights or dict.fromkeys(STRATA[stratify], 1.0)
+        reservoir = StratifiedReservoir(sample_size, weights, seed)
+
+        visitor = functools.partial(ReservoirVisitor, reservoir, stratify,
+                                    max_plies=max_samples_per_game, packed=self.packed)
+        games = iter_pgn_games(self.pgn_file, max_games, variant_filter,
+                               use_index=self.use_index,
+                               index_filter=self.index_filter,
+                               start_game=self.start_game,
+                               visitor=visitor)
+        for game_number, game in enumerate(games, self.start_game):
+            for sample in game['records']:
+                if sample is not None:
+                    sample['game'] = game_number
+
+        samples = reservoir.items
+        random.Random(seed).shuffle(samples)
+        print(f"从 {reservoir.seen} 个位置中抽取了 {len(samples)} 个样本")
+        if stratify:
+            reservoir.report()
         return samples
 
-    def board_to_tensor(self, board):
-        """将棋盘状态转换为8x8x12的张量"""
-        tensor = np.zeros((8, 8, 12), dtype=np.float32)
+    def iter_samples_parallel(self, workers=None, max_games=None, variant_filter=None,
+                              max_samples=None, max_samples_per_game=100, games_per_shard=100):
+        """
+        多进程模式：按索引在对局边界切分文件，各进程并行解析并编码分片，
+        样本按文件中的对局顺序合并产出，结果与单进程模式一致
+        """
+        entries = select_entries(self.pgn_file, max_games, variant_filter,
+                                 self.index_filter, self.start_game)
 
-        piece_to_index = {
-            'P': 0, 'N': 1, 'B': 2, 'R': 3, 'Q': 4, 'K': 5,
-            'p': 6, 'n': 7, 'b': 8, 'r': 9, 'q': 10, 'k': 11
-        }
+        sample_count = 0
+        game_number = self.start_game
+        shard_results = map_game_shards(_extract_shard, self.pgn_file, entries, workers,
+                                        games_per_shard, args=(max_samples_per_game, self.packed))
+        for games in shard_results:
+            for samples in games:
+                for sample in samples:
+                    sample['game'] = game_number
+                    yield sample
+                    sample_count += 1
+                    if max_samples and sample_count >= max_samples:
+                        shard_results.close()
+                        return
+                game_number += 1
 
-        for square in chess.SQUARES:
-            piece = board.piece_at(square)
-            if piece:
-                row = square // 8
-                col = square % 8
-                piece_char = piece.symbol()
-                tensor[row, col, piece_to_index[piece_char]] = 1.0
+    def extract_training_samples(self, game, max_samples_per_game=100):
+        """
+        从单个对局中提取训练样本（沿主变体，见 SampleVisitor）
+        返回: [{board_bits 或 board_state, move, eval, result}, ...]
+        """
+        visitor = SampleVisitor(max_plies=max_samples_per_game, packed=self.packed)
+        return game.accept(visitor)['records']
 
-        return tensor
+    def board_to_tensor(self, board):
+        """将棋盘状态转换为8x8x12的张量"""
+        return board_to_tensor(board)
 
     def move_to_index(self, move, board):
         """将走法转换为索引（简化版，实际需要更复杂的编码）"""
         # 简化处理：返回走法的UCI表示
         return move.uci()
 
-    def export_to_json(self, output_file, max_samples=10000):
-        """导出训练数据到JSON文件"""
+    def export_to_json(self, output_file, max_samples=10000, streaming=False,
+                       max_games=None, variant_filter=None, workers=None,
+                       sampling='first', stratify=None, seed=42):
+        """
+        导出训练数据到JSON文件
+        streaming=True 时直接从PGN文件流式读取（无需先调用parse_pgn），
+        样本逐条写入文件，内存占用与数据量无关，返回写入的样本数
+        workers>1 时使用多进程分片解析（输出顺序与单进程相同）
+        sampling='reservoir' 时从整个文件中抽取 max_samples 个位置（见 reservoir_samples），
+        总是流式写入；stratify 为分层方式
+        """
+        if streaming or sampling == 'reservoir':
+            samples = self._sample_source(workers, max_games, variant_filter, max_samples,
+                                          sampling, stratify, seed)
+            with JsonSampleWriter(output_file) as writer:
+                return self._export_streaming(writer, samples, output_file)
+
         all_samples = []
         sample_count = 0
 
-        for game in self.games:
+        for game_number, game in enumerate(self.games):
             samples = self.extract_training_samples(game)
+            for sample in samples:
+                sample['game'] = game_number
             all_samples.extend(samples)
             sample_count += len(samples)
 
@@ -127,12 +332,7 @@ class ChessDataExtractor:
         # 转换为可序列化的格式
         export_data = []
         for sample in all_samples:
-            export_data.append({
-                'board_state': sample['board_state'].tolist(),
-                'move': sample['move'],
-                'eval': float(sample['eval']),
-                'result': float(sample['result'])
-            })
+            export_data.append(self.sample_to_json(sample))
 
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(export_data, f, indent=2)
@@ -140,6 +340,58 @@ class ChessDataExtractor:
         print(f"数据已保存到 {output_file}")
         return export_data
 
+    def export_to_dataset(self, output_dir, max_samples=None, max_games=None,
+                          variant_filter=None, workers=None, shard_size=1000000,
+                          sampling='first', stratify=None, seed=42):
+        """流式导出训练数据为二进制分片数据集（见 dataset_io），返回写入的样本数"""
+        samples = self._sample_source(workers, max_games, variant_filter, max_samples,
+                                      sampling, stratify, seed)
+        with ShardWriter(output_dir, shard_size=shard_size) as writer:
+            return self._export_streaming(writer, samples, output_dir)
+
+    def _sample_source(self, workers, max_games, variant_filter, max_samples,
+                       sampling='first', stratify=None, seed=42):
+        if sampling == 'reservoir':
+            # 蓄水池抽样必须单遍读完整个文件，不使用多进程
+            return self.reservoir_samples(max_samples, max_games, variant_filter,
+                                          stratify=stratify, seed=seed)
+        if sampling != 'first':
+            raise ValueError(f"未知的抽样方式: {sampling}")
+        if workers and workers > 1 and not self.compressed:
+            return self.iter_samples_parallel(workers, max_games, variant_filter, max_samples)
+        return self.iter_samples(max_games, variant_filter, max_samples)
+
+    def _export_streaming(self, writer, samples, output_path):
+        """流式导出：样本逐条写入，不在内存中累积"""
+        for sample in samples:
+            writer.write(self.sample_to_json(sample))
+
+        print(f"提取了 {writer.count} 个训练样本")
+        print(f"数据已保存到 {output_path}")
+        return writer.count
+
+    @staticmethod
+    def sample_to_json(sample):
+        """将样本转换为可序列化的格式"""
+        if 'board_bits' in sample:
+            data = {'board_bits': [int(bits) for bits in sample['board_bits']]}
+        else:
+            data = {'board_state': sample['board_state'].tolist()}
+        data.update({
+            'move': sample['move'],
+            'eval': float(sample['eval']),
+            'result': float(sample['result'])
+        })
+        if 'game' in sample:
+            data['game'] = int(sample['game'])
+        return data
+
+
+def _extract_shard(pgn_file, offsets, max_samples_per_game, packed):
+    """子进程：解析一个分片内的对局并提取样本，按对局分组返回"""
+    visitor = functools.partial(SampleVisitor, max_plies=max_samples_per_game, packed=packed)
+    return [game['records'] for game in read_games_at(pgn_file, offsets, visitor)]
+
 
 def main():
     # 配置
@@ -151,11 +403,9 @@ def main():
     # 创建解析器
     extractor = ChessDataExtractor(pgn_file)
 
-    # 解析PGN（只解析标准国际象棋对局）
-    extractor.parse_pgn(max_games=500)  # 解析500局
-
-    # 导出训练数据
-    extractor.export_to_json(output_file, max_samples=20000)
+    # 流式解析并导出训练数据（最多500局，达到样本上限后提前停止）
+    extractor.export_to_json(output_file, max_samples=20000, streaming=True, max_games=500,
+                             workers=os.cpu_count())
 
     print("\n数据准备完成！")
 
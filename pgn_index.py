@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+PGN对局索引 - 记录每局对局在文件中的字节偏移和头信息
+只扫描头信息和走法文本（不解析走法），索引保存为边车文件 <pgn>.idx，
+后续工具可按头信息过滤，直接跳转到需要的对局，也可以从文件中间继续处理
+"""
+
+import functools
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import chess.pgn
+
+from pgn_io import is_compressed, open_pgn
+
+INDEX_VERSION = 1
+
+# 索引中保存的头信息
+INDEX_HEADERS = ('Variant', 'Result', 'WhiteElo', 'BlackElo', 'TimeControl')
+
+HEADER_RE = re.compile(rb'^\[([A-Za-z0-9_]+)\s+"(.*)"\]\s*$')
+COMMENT_RE = re.compile(rb'\{[^}]*\}')
+LINE_COMMENT_RE = re.compile(rb';[^\n]*')
+VARIATION_RE = re.compile(rb'\([^()]*\)')
+MOVE_NUMBER_RE = re.compile(rb'\d+\.+')
+NON_MOVE_TOKENS = {b'1-0', b'0-1', b'1/2-1/2', b'*'}
+
+
+def count_plies(movetext):
+    """统计走法文本中主变体的半回合数（去掉注释、变体、NAG和回合号）"""
+    text = LINE_COMMENT_RE.sub(b' ', movetext)
+    text = COMMENT_RE.sub(b' ', text)
+    while True:
+        stripped = VARIATION_RE.sub(b' ', text)
+        if stripped == text:
+            break
+        text = stripped
+    text = MOVE_NUMBER_RE.sub(b' ', text)
+
+    plies = 0
+    for token in text.split():
+        if token in NON_MOVE_TOKENS or token.startswith(b'$'):
+            continue
+        plies += 1
+    return plies
+
+
+class PgnGameIndex:
+    def __init__(self, pgn_file, index_file=None):
+        self.pgn_file = pgn_file
+        self.index_file = index_file or pgn_file + '.idx'
+        self.entries = []
+
+    def _source_stat(self):
+        stat = os.stat(self.pgn_file)
+        return {'pgn_size': stat.st_size, 'pgn_mtime_ns': stat.st_mtime_ns}
+
+    def build(self):
+        """
+        扫描PGN文件建立索引
+        每局记录: game(序号), offset(首个头信息行的字节偏移), plies(主变体半回合数), headers
+        """
+        if is_compressed(self.pgn_file):
+            raise ValueError(f"压缩的PGN文件不支持索引（无法按字节偏移跳转）: {self.pgn_file}")
+
+        entries = []
+        current = None
+        movetext = []
+        state = 'start'  # start / headers / between / moves
+        in_comment = False
+
+        def finish():
+            if current is not None:
+                current['plies'] = count_plies(b' '.join(movetext))
+                entries.append(current)
+
+        with open(self.pgn_file, 'rb') as f:
+            offset = 0
+            for line in f:
+                line_offset = offset
+                offset += len(line)
+                if line_offset == 0 and line.startswith(b'\xef\xbb\xbf'):
+                    line = line[3:]
+                    line_offset = 3
+
+                stripped = line.strip()
+                if not stripped:
+                    if state == 'headers':
+                        state = 'between'
+                    continue
+
+                if not in_comment and stripped.startswith(b'['):
+                    match = HEADER_RE.match(stripped)
+                    if match:
+                        if state != 'headers':
+                            finish()
+                            current = {'game': len(entries), 'offset': line_offset, 'headers': {}}
+                            movetext = []
+                        state = 'headers'
+                        key = match.group(1).decode('utf-8', 'replace')
+                        if key in INDEX_HEADERS:
+                            current['headers'][key] = match.group(2).decode('utf-8', 'replace')
+                        continue
+
+                if current is None:
+                    continue
+
+                # 走法文本（注释可能跨行）
+                state = 'moves'
+                movetext.append(stripped)
+                opened = stripped.count(b'{')
+                closed = stripped.count(b'}')
+                if opened != closed:
+                    in_comment = opened > closed
+
+        finish()
+        self.entries = entries
+        print(f"索引完成: {len(entries)} 局对局")
+        return entries
+
+    def save(self):
+        """保存索引（JSON Lines：第一行为元信息，之后每行一局）"""
+        meta = {'version': INDEX_VERSION, 'games': len(self.entries)}
+        meta.update(self._source_stat())
+
+        tmp_file = self.index_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(meta) + '\n')
+            for entry in self.entries:
+                f.write(json.dumps([entry['offset'], entry['plies'], entry['headers']]) + '\n')
+        os.replace(tmp_file, self.index_file)
+        print(f"索引已保存到 {self.index_file}")
+
+    def load(self):
+        """加载索引，PGN文件已变化（大小或修改时间不同）时返回False"""
+        if not os.path.exists(self.index_file):
+            return False
+
+        with open(self.index_file, 'r', encoding='utf-8') as f:
+            meta = json.loads(f.readline())
+            if meta.get('version') != INDEX_VERSION:
+                return False
+            source = self._source_stat()
+            if any(meta.get(key) != value for key, value in source.items()):
+                return False
+
+            entries = []
+            for line in f:
+                offset, plies, headers = json.loads(line)
+                entries.append({'game': len(entries), 'offset': offset,
+                                'plies': plies, 'headers': headers})
+
+        self.entries = entries
+        return True
+
+    def load_or_build(self):
+        """优先加载已有索引，不存在或已过期时重新扫描并保存"""
+        if not self.load():
+            self.build()
+            self.save()
+        return self.entries
+
+    def filter(self, variant=None, result=None, min_elo=None, max_elo=None,
+               time_control=None, min_plies=None):
+        """
+        按头信息过滤对局
+        variant: 变体名称（缺省头信息视为Standard）
+        min_elo/max_elo: 双方等级分都需满足，缺失等级分的对局会被排除
+        """
+        selected = []
+        for entry in self.entries:
+            headers = entry['headers']
+            if variant and headers.get('Variant', 'Standard') != variant:
+                continue
+            if result and headers.get('Result', '*') != result:
+                continue
+            if time_control and headers.get('TimeControl') != time_control:
+                continue
+            if min_plies and entry['plies'] < min_plies:
+                continue
+            if min_elo or max_elo:
+                elos = [self._parse_elo(headers.get(key)) for key in ('WhiteElo', 'BlackElo')]
+                if None in elos:
+                    continue
+                if min_elo and min(elos) < min_elo:
+                    continue
+                if max_elo and max(elos) > max_elo:
+                    continue
+            selected.append(entry)
+        return selected
+
+    @staticmethod
+    def _parse_elo(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def iter_games(self, entries=None):
+        """按索引跳转读取对局，产出 (entry, game)"""
+        if entries is None:
+            entries = self.entries
+
+        games = read_games_at(self.pgn_file, [entry['offset'] for entry in entries])
+        yield from zip(entries, games)
+
+
+def iter_pgn_games(pgn_file, max_games=None, variant_filter=None,
+                   use_index=False, index_filter=None, start_game=0,
+                   start_offset=0, with_offsets=False, visitor=None, with_end_offsets=False):
+    """
+    逐局读取PGN对局（生成器），支持压缩文件（见 pgn_io）
+    use_index=True 时先按索引头信息过滤，只解析被选中的对局，
+    start_game 表示跳过过滤结果中的前N局（用于从文件中间继续处理；
+    不使用索引时只读头信息跳过）
+    start_offset: 不使用索引时从该字节偏移（必须是某局的开头）开始读取，压缩文件不支持
+    with_offsets=True 时产出 (对局字节偏移, 对局)，压缩文件的偏移为None；
+    同时 with_end_offsets=True 时产出 (对局字节偏移, 对局结束偏移, 对局)，结束偏移即下一局开始读取的位置
+    （从检查点继续时用它跳过已写完的对局；使用索引时为None）
+    visitor: MainlineVisitor 子类（或其 functools.partial），给出时不建立GameNode树，
+    产出访问器的 result()，变体过滤在读完头信息时完成（见 pgn_mainline）
+    """
+    if use_index:
+        entries = select_entries(pgn_file, max_games, variant_filter, index_filter, start_game)
+        offsets = [entry['offset'] for entry in entries]
+        games = read_games_at(pgn_file, offsets, visitor)
+        if with_offsets and with_end_offsets:
+            yield from ((offset, None, game) for offset, game in zip(offsets, games))
+        else:
+            yield from (zip(offsets, games) if with_offsets else games)
+        return
+
+    if visitor:
+        visitor = functools.partial(visitor, variant_filter=variant_filter)
+
+    compressed = is_compressed(pgn_file)
+    if compressed and start_offset:
+        raise ValueError(f"压缩的PGN文件不能按字节偏移跳转: {pgn_file}")
+
+    games_read = 0
+    with open_pgn(pgn_file) as f:
+        if start_offset:
+            f.seek(start_offset)
+
+        skipped = 0
+        while skipped < start_game:
+            headers = chess.pgn.read_headers(f)
+            if headers is None:
+                return
+            if not variant_filter or headers.get('Variant', 'Standard') == variant_filter:
+                skipped += 1
+
+        while True:
+            offset = f.tell() if with_offsets and not compressed else None
+            if visitor:
+                game = chess.pgn.read_game(f, Visitor=visitor)
+                if game is None:
+                    break
+                if game['skipped']:
+                    continue
+            else:
+                game = chess.pgn.read_game(f)
+                if game is None:
+                    break
+
+                # 过滤变体
+                if variant_filter:
+                    variant = game.headers.get('Variant', 'Standard')
+                    if variant != variant_filter:
+                        continue
+
+            if with_offsets and with_end_offsets:
+                yield offset, f.tell() if not compressed else None, game
+            else:
+                yield (offset, game) if with_offsets else game
+            games_read += 1
+            if max_games and games_read >= max_games:
+                break
+
+
+def select_entries(pgn_file, max_games=None, variant_filter=None,
+                   index_filter=None, start_game=0):
+    """加载（或建立）索引并返回过滤后的对局条目"""
+    index = PgnGameIndex(pgn_file)
+    index.load_or_build()
+    entries = index.filter(variant=variant_filter, **(index_filter or {}))[start_game:]
+    if max_games:
+        entries = entries[:max_games]
+    return entries
+
+
+def read_games_at(pgn_file, offsets, visitor=None):
+    """按字节偏移逐局读取对局（生成器），visitor 同 iter_pgn_games"""
+    with open(pgn_file, 'r', encoding='utf-8') as f:
+        for offset in offsets:
+            f.seek(offset)
+            game = chess.pgn.read_game(f, Visitor=visitor) if visitor else chess.pgn.read_game(f)
+            if game is None:
+                break
+            yield game
+
+
+def map_game_shards(func, pgn_file, entries, workers=None, games_per_shard=100, args=()):
+    """
+    多进程分片处理对局
+    按对局边界把 entries 切成分片，每个分片调用 func(pgn_file, offsets, *args)，
+    结果严格按分片顺序产出（与worker数量无关，可复现）；
+    同时在途的分片数限制为 worker数 x 2，内存占用不随文件大小增长
+    func 必须是模块级函数（Windows下子进程需要能导入它）
+    """
+    shards = [[entry['offset'] for entry in entries[i:i + games_per_shard]]
+              for i in range(0, len(entries), games_per_shard)]
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        next_shard = 0
+        try:
+            while pending or next_shard < len(shards):
+                while next_shard < len(shards) and len(pending) < max_in_flight:
+                    pending.append(executor.submit(func, pgn_file, shards[next_shard], *args))
+                    next_shard += 1
+                yield pending.pop(0).result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("用法: python pgn_index.py <pgn文件>")
+        return
+
+    index = PgnGameIndex(sys.argv[1])
+    index.build()
+    index.save()
+
+    variants = {}
+    for entry in index.entries:
+        variant = entry['headers'].get('Variant', 'Standard')
+        variants[variant] = variants.get(variant, 0) + 1
+    print(f"变体分布: {variants}")
+    print(f"总半回合数: {sum(entry['plies'] for entry in index.entries)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+PGN文件读取 - 透明支持压缩输入（gzip / bzip2 / xz / zstd）
+lichess数据库以 .pgn.zst 发布，直接流式解压读取，不需要先解压到磁盘
+按文件头的魔数识别压缩格式（与扩展名无关）；zstd 需要可选依赖 zstandard
+
+压缩流不能按字节偏移跳转: 索引、多进程分片和按偏移继续处理只支持未压缩的PGN，
+压缩输入改为顺序读取，继续处理时按对局数跳过（只读头信息）
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+
+# 解压后的读缓冲区，较大的块减少Python层的调用次数
+READ_BUFFER_SIZE = 1 << 20
+
+MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bzip2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+)
+
+
+def detect_compression(path):
+    """按文件头识别压缩格式，未压缩返回None"""
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    for magic, name in MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def is_compressed(path):
+    return detect_compression(path) is not None
+
+
+def _open_zstd(path):
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("读取 .zst 压缩的PGN需要安装 zstandard: pip install zstandard") from None
+
+    raw = open(path, 'rb')
+    # 数据库文件可能由多个zstd帧拼接而成
+    return zstandard.ZstdDecompressor().stream_reader(raw, read_size=READ_BUFFER_SIZE,
+                                                     read_across_frames=True, closefd=True)
+
+
+def open_pgn(path):
+    """以文本模式打开PGN文件（压缩文件边读边解压）"""
+    compression = detect_compression(path)
+    if compression is None:
+        return open(path, 'r', encoding='utf-8')
+
+    if compression == 'gzip':
+        binary = gzip.open(path, 'rb')
+    elif compression == 'bzip2':
+        binary = bz2.open(path, 'rb')
+    elif compression == 'xz':
+        binary = lzma.open(path, 'rb')
+    else:
+        binary = _open_zstd(path)
+
+    return io.TextIOWrapper(io.BufferedReader(binary, READ_BUFFER_SIZE), encoding='utf-8')
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+轻量PGN主变体解析 - 基于 chess.pgn.BaseVisitor
+chess.pgn.read_game 默认会为每局建立完整的GameNode树（保留所有注释和变体），
+而训练数据只需要沿主变体走一遍；访问器只在一个棋盘上走主变体，
+边解析边生成每个半回合的记录，直接从注释中提取 [%eval]/[%clk]，
+变体整段跳过不解析，变体不符的对局在读完头信息后直接跳过走法文本，
+达到半回合上限后不再解析后面的SAN走法
+
+用法: 子类覆盖 on_ply(board, move, ply) 返回每个半回合的记录，
+read_game(handle, Visitor=functools.partial(子类, ...)) 返回 result()
+"""
+
+import logging
+import re
+
+import chess.pgn
+
+LOGGER = logging.getLogger(__name__)
+
+EVAL_RE = re.compile(r'\[%eval\s+([^\]\s]+)')
+CLK_RE = re.compile(r'\[%clk\s+([^\]\s]+)')
+
+
+def parse_eval_annotation(text):
+    """
+    把 [%eval] 的值转换为与引擎输出相同格式的info（白方视角）:
+    '0.35' -> cp 35, '#-3' -> mate -3；可带 ',深度' 后缀（如 '0.35,22'），无深度时 depth 为0
+    无法解析时返回None
+    """
+    value, _, depth = text.partition(',')
+    try:
+        if value.startswith('#'):
+            info = {'score_type': 'mate', 'score': int(value[1:])}
+        else:
+            info = {'score_type': 'cp', 'score': round(float(value) * 100)}
+    except ValueError:
+        return None
+    info['depth'] = int(depth) if depth.isdigit() else 0
+    return info
+
+
+def parse_clock(text):
+    """把 [%clk h:mm:ss(.f)] 的值转换为秒"""
+    seconds = 0.0
+    for part in text.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+class MainlineVisitor(chess.pgn.BaseVisitor):
+    """
+    variant_filter: 只保留该变体（缺省头信息视为Standard），其他对局读完头信息即跳过
+    max_plies: 只记录主变体的前N个半回合（None表示全部）
+
+    result() 返回字典:
+        headers: 头信息, skipped: 是否被变体过滤跳过,
+        root_fen: 起始局面（标准初始局面为None）, moves: 走法UCI,
+        records: 每个半回合 on_ply 的返回值,
+        evals/clocks: 每个半回合走完之后注释里的 [%eval]/[%clk] 原始文本，没有为None
+    """
+
+    def __init__(self, variant_filter=None, max_plies=None):
+        self.variant_filter = variant_filter
+        self.max_plies = max_plies
+
+    def begin_game(self):
+        self.headers = {}
+        self.skipped = False
+        self.root_fen = None
+        self.moves = []
+        self.records = []
+        self.evals = []
+        self.clocks = []
+        self.truncated = False
+
+    def visit_header(self, tagname, tagvalue):
+        self.headers[tagname] = tagvalue
+
+    def end_headers(self):
+        if self.variant_filter and self.headers.get('Variant', 'Standard') != self.variant_filter:
+            self.skipped = True
+            return chess.pgn.SKIP
+        return None
+
+    def _full(self):
+        return self.max_plies is not None and len(self.moves) >= self.max_plies
+
+    def begin_parse_san(self, board, san):
+        # 达到半回合上限后不再解析后面的走法
+        if self._full():
+            self.truncated = True
+            return chess.pgn.SKIP
+        return None
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def visit_move(self, board, move):
+        if self._full():
+            self.truncated = True
+            return
+        ply = len(self.moves)
+        if ply == 0 and board.fen() != chess.STARTING_FEN:
+            self.root_fen = board.fen()
+        self.records.append(self.on_ply(board, move, ply))
+        self.moves.append(move.uci())
+        self.evals.append(None)
+        self.clocks.append(None)
+
+    def visit_comment(self, comment):
+        # 注释属于最近一步走完之后的局面；开局前的注释和上限之后的注释忽略
+        if not self.moves or self.truncated or '[%' not in comment:
+            return
+        if self.evals[-1] is None:
+            match = EVAL_RE.search(comment)
+            if match:
+                self.evals[-1] = match.group(1)
+        if self.clocks[-1] is None:
+            match = CLK_RE.search(comment)
+            if match:
+                self.clocks[-1] = match.group(1)
+
+    def on_ply(self, board, move, ply):
+        """
+        每个主变体半回合调用一次，board 为走棋之前的局面（不能修改）
+        返回值保存到 records
+        """
+        return None
+
+    def handle_error(self, error):
+        # 与 GameBuilder 相同: 记录错误，主变体在出错的走法处结束
+        LOGGER.error("%s while parsing %r", error, self.headers)
+
+    def result(self):
+        return {
+            'headers': self.headers,
+            'skipped': self.skipped,
+            'root_fen': self.root_fen,
+            'moves': self.moves,
+            'records': self.records,
+            'evals': self.evals,
+            'clocks': self.clocks,
+        }
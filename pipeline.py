@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+分阶段流水线 - 每个阶段在后台线程中运行，阶段之间用有界队列连接
+下游处理不过来时上游在 put 处阻塞（背压），内存占用由队列长度决定；
+解析/编码（Python）与引擎搜索（子进程）因此可以同时进行
+
+每个阶段统计三部分时间: 等待上游（输入队列为空）、实际工作、等待下游（输出队列已满），
+以及输出队列的平均占用率；这些时间都按整个流水线的运行时间归一化，
+工作时间最长的阶段就是瓶颈（提前结束的阶段按自身寿命计算会显得很忙，不能据此判断），
+它的上游队列通常接近满，下游队列接近空
+
+用法:
+    pipeline = Pipeline(queue_size=32)
+    parsed = pipeline.stage('parse', iter_games(...))
+    labelled = pipeline.stage('label', label(parsed))
+    for item in pipeline.consume('write', labelled):
+        ...
+    pipeline.close()
+    pipeline.report()
+"""
+
+import queue
+import threading
+import time
+
+# 阶段结束标记（随后附带异常或None）
+_DONE = object()
+
+# 阻塞在队列上时定期检查是否已停止（Windows下无超时的阻塞不能被Ctrl-C中断）
+POLL_INTERVAL = 0.1
+
+
+class Stage:
+    """
+    在后台线程中迭代 iterable，结果依次放入长度为 maxsize 的队列；
+    迭代 Stage 对象即从队列中取出结果（阶段内的异常在取出时重新抛出）
+    """
+
+    def __init__(self, name, iterable, maxsize, stop_event, upstream=None):
+        self.name = name
+        self.iterable = iterable
+        self.maxsize = maxsize
+        self.queue = queue.Queue(maxsize)
+        self.stop_event = stop_event
+        self.upstream = upstream
+        self.items = 0
+        self.output_wait = 0.0  # 等待下游取走结果的时间
+        self.consumer_wait = 0.0  # 下游等待本阶段结果的时间
+        self.occupancy = 0  # 每次放入后队列长度之和（用于平均占用率）
+        self.start_time = None
+        self.end_time = None
+        self.thread = threading.Thread(target=self._run, name=f"pipeline-{name}", daemon=True)
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.thread.start()
+
+    def _run(self):
+        error = None
+        try:
+            for item in self.iterable:
+                if not self._put(item):
+                    return
+                self.items += 1
+        except Exception as e:
+            error = e
+        finally:
+            self.end_time = time.perf_counter()
+        self._put(_DONE)
+        self._put(error)
+
+    def _put(self, item):
+        start = time.perf_counter()
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    self.queue.put(item, timeout=POLL_INTERVAL)
+                    self.occupancy += self.queue.qsize()
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self.output_wait += time.perf_counter() - start
+
+    def _get(self):
+        start = time.perf_counter()
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    return self.queue.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+            return _DONE
+        finally:
+            self.consumer_wait += time.perf_counter() - start
+
+    def __iter__(self):
+        while True:
+            item = self._get()
+            if item is _DONE:
+                error = None if self.stop_event.is_set() else self.queue.get()
+                if error is not None:
+                    raise error
+                return
+            yield item
+
+    def elapsed(self):
+        end = self.end_time or time.perf_counter()
+        return end - self.start_time if self.start_time else 0.0
+
+    def metrics(self):
+        """返回 {items, elapsed, input_wait, work, output_wait, occupancy}"""
+        elapsed = self.elapsed()
+        input_wait = self.upstream.consumer_wait if self.upstream else 0.0
+        return {
+            'items': self.items,
+            'elapsed': elapsed,
+            'input_wait': input_wait,
+            'work': max(elapsed - input_wait - self.output_wait, 0.0),
+            'output_wait': self.output_wait,
+            'occupancy': self.occupancy / self.items / self.maxsize if self.items else 0.0,
+        }
+
+
+class Pipeline:
+    """
+    queue_size: 阶段之间队列的默认长度（以条目为单位，如对局数）
+    """
+
+    def __init__(self, queue_size=32):
+        self.queue_size = queue_size
+        self.stop_event = threading.Event()
+        self.stages = []
+        self.consumer = None
+        self.start_time = None
+
+    def stage(self, name, iterable, queue_size=None):
+        """启动一个阶段；iterable 通常是对上一个阶段（Stage对象）的惰性变换"""
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        upstream = self.stages[-1] if self.stages else None
+        stage = Stage(name, iterable, queue_size or self.queue_size, self.stop_event, upstream)
+        stage.start()
+        self.stages.append(stage)
+        return stage
+
+    def consume(self, name, stage):
+        """在当前线程中迭代最后一个阶段的结果（最后一个阶段，如写入）"""
+        self.consumer = {'name': name, 'items': 0, 'start': time.perf_counter(), 'end': None}
+        try:
+            for item in stage:
+                yield item
+                self.consumer['items'] += 1
+        finally:
+            self.consumer['end'] = time.perf_counter()
+
+    def close(self, timeout=5):
+        """停止所有阶段（中断或出错时，阻塞在队列上的线程随即退出）"""
+        self.stop_event.set()
+        for stage in self.stages:
+            stage.thread.join(timeout)
+
+    def metrics(self):
+        """按阶段顺序返回 [(阶段名, 统计)]，最后一项为当前线程中的消费阶段"""
+        results = [(stage.name, stage.metrics()) for stage in self.stages]
+        if self.consumer is not None:
+            end = self.consumer['end'] or time.perf_counter()
+            elapsed = end - self.consumer['start']
+            input_wait = self.stages[-1].consumer_wait if self.stages else 0.0
+            results.append((self.consumer['name'], {
+                'items': self.consumer['items'],
+                'elapsed': elapsed,
+                'input_wait': input_wait,
+                'work': max(elapsed - input_wait, 0.0),
+                'output_wait': 0.0,
+                'occupancy': None,
+            }))
+        return results
+
+    def elapsed(self):
+        """整个流水线的运行时间: 第一个阶段启动到最后一个阶段（或消费阶段）结束"""
+        if self.start_time is None:
+            return 0.0
+        ends = [stage.end_time for stage in self.stages]
+        if self.consumer is not None:
+            ends.append(self.consumer['end'])
+        end = time.perf_counter() if None in ends else max(ends)
+        return end - self.start_time
+
+    def report(self):
+        """
+        打印每个阶段的吞吐量、时间分布（占整个流水线运行时间的比例）和队列占用率，
+        工作时间最长的阶段即为瓶颈
+        """
+        results = self.metrics()
+        if not results:
+            return
+        elapsed = self.elapsed() or 1e-9
+        print(f"Pipeline stages over {elapsed:.1f}s (work / waiting for input / blocked on output):")
+        for name, stats in results:
+            rate = stats['items'] / stats['work'] if stats['work'] else 0.0
+            line = (f"  {name:12s} {stats['items']:7d} items, {rate:8.1f} items/sec of work, "
+                    f"{stats['work'] / elapsed:4.0%} / {stats['input_wait'] / elapsed:4.0%} / "
+                    f"{stats['output_wait'] / elapsed:4.0%}")
+            if stats['occupancy'] is not None:
+                line += f", queue {stats['occupancy']:.0%} full"
+            print(line)
+        bottleneck = max(results, key=lambda result: result[1]['work'])
+        print(f"  Bottleneck: {bottleneck[0]}")
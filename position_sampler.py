@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+位置采样 - 解析与Stockfish标注之间的过滤阶段
+默认的“每局前N个半回合”会把大部分引擎预算花在几乎相同的开局局面上，
+采样器按以下顺序过滤候选位置，并统计每个过滤条件节省的引擎调用次数:
+    1. 跳过每局前 skip_plies 个半回合
+    2. 只保留安静局面（不被将军，实际走法不是吃子或升变）
+    3. 按Zobrist哈希在整个语料中去重（包括之前的对局）
+    4. 每局最多保留N个位置: 取最前面的(first)、均匀随机(uniform)或按对局阶段配额(phase)
+
+另有蓄水池抽样（Reservoir / StratifiedReservoir），从任意大的对局流中单遍抽取固定数量的位置
+"""
+
+import math
+import os
+import random
+
+import chess
+import numpy as np
+
+PHASES = ('opening', 'middlegame', 'endgame')
+
+# 子力阶段值（不含兵和王），初始局面合计62
+PHASE_MATERIAL = {chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5, chess.QUEEN: 9}
+ENDGAME_MATERIAL = 26
+OPENING_PLIES = 20
+
+FILTERS = ('skip_plies', 'not_quiet', 'duplicate', 'sampling')
+
+
+def game_phase(board, ply):
+    """按剩余子力和半回合数判断对局阶段"""
+    material = sum(chess.popcount(board.pieces_mask(piece_type, chess.WHITE)
+                                  | board.pieces_mask(piece_type, chess.BLACK)) * value
+                   for piece_type, value in PHASE_MATERIAL.items())
+    if material <= ENDGAME_MATERIAL:
+        return 'endgame'
+    if ply < OPENING_PLIES:
+        return 'opening'
+    return 'middlegame'
+
+
+def is_quiet(board, move):
+    """安静局面: 走棋方未被将军，且对局中实际走法不是吃子或升变"""
+    return not (board.is_check() or board.is_capture(move) or move.promotion)
+
+
+class PositionSampler:
+    """
+    mode: 'first'（每局最前面的位置）、'uniform'（均匀随机）或 'phase'（按阶段配额）
+    phase_weights: mode='phase' 时各阶段占每局名额的比例，某阶段候选不足时名额由其他阶段补足
+    seed: 随机采样的种子，每局的随机数由 (seed, 对局字节偏移) 决定，中断后继续运行结果不变
+    """
+
+    def __init__(self, skip_plies=8, dedupe=True, mode='uniform', quiet_only=False,
+                 phase_weights=None, seed=42):
+        if mode not in ('first', 'uniform', 'phase'):
+            raise ValueError(f"未知的采样方式: {mode}")
+        self.skip_plies = skip_plies
+        self.dedupe = dedupe
+        self.mode = mode
+        self.quiet_only = quiet_only
+        self.phase_weights = phase_weights or {'opening': 0.2, 'middlegame': 0.4, 'endgame': 0.4}
+        self.seed = seed
+        self.seen = set()
+        self.candidates = 0
+        self.kept = 0
+        self.dropped = {name: 0 for name in FILTERS}
+
+    def sample(self, game_data, max_positions):
+        """过滤一局的候选位置，返回只含保留位置的 game_data"""
+        positions = game_data['positions']
+        self.candidates += len(positions)
+
+        selected = []
+        game_keys = set()
+        for i, position in enumerate(positions):
+            if game_data['plies'][i] < self.skip_plies:
+                self.dropped['skip_plies'] += 1
+            elif self.quiet_only and not game_data['quiet'][i]:
+                self.dropped['not_quiet'] += 1
+            elif self.dedupe and (position[3] in self.seen or position[3] in game_keys):
+                self.dropped['duplicate'] += 1
+            else:
+                game_keys.add(position[3])
+                selected.append(i)
+
+        kept = self._choose(selected, game_data, max_positions)
+        self.dropped['sampling'] += len(selected) - len(kept)
+        self.kept += len(kept)
+        if self.dedupe:
+            self.seen.update(positions[i][3] for i in kept)
+
+        sampled = dict(game_data)
+        for name in ('positions', 'plies', 'phases', 'quiet'):
+            sampled[name] = [game_data[name][i] for i in kept]
+        return sampled
+
+    def _choose(self, selected, game_data, max_positions):
+        if not max_positions or len(selected) <= max_positions:
+            return selected
+        if self.mode == 'first':
+            return selected[:max_positions]
+
+        rng = random.Random(f"{self.seed}:{game_data['offset']}")
+        if self.mode == 'uniform':
+            return sorted(rng.sample(selected, max_positions))
+
+        by_phase = {phase: [i for i in selected if game_data['phases'][i] == phase] for phase in PHASES}
+        chosen = []
+        for phase in PHASES:
+            quota = round(max_positions * self.phase_weights.get(phase, 0.0))
+            candidates = by_phase[phase]
+            chosen += rng.sample(candidates, min(quota, len(candidates)))
+        # 某些阶段候选不足，剩余名额从未选中的位置中补足
+        taken = set(chosen)
+        rest = [i for i in selected if i not in taken]
+        chosen += rng.sample(rest, min(max_positions - len(chosen), len(rest)))
+        return sorted(chosen[:max_positions])
+
+    def apply(self, game_iter, max_positions):
+        """对一系列对局逐局采样（生成器）"""
+        for game_data in game_iter:
+            yield self.sample(game_data, max_positions)
+
+    def report(self):
+        """打印每个过滤条件节省的引擎调用次数"""
+        print(f"Position sampler: {self.candidates} candidates, {self.kept} kept "
+              f"({self.kept / self.candidates if self.candidates else 0.0:.1%})")
+        for name in FILTERS:
+            print(f"  {name}: {self.dropped[name]} engine calls saved")
+
+
+class SeenKeyLog:
+    """
+    去重集合的持久化: 已写入样本的Zobrist键按顺序追加到二进制文件（int64），
+    检查点记录键的个数，继续运行时截到该长度并重新载入采样器
+    """
+
+    def __init__(self, path, resume_count=None):
+        self.path = path
+        self.count = 0
+        if resume_count is not None and os.path.exists(path):
+            with open(path, 'r+b') as f:
+                f.truncate(resume_count * 8)
+            self.count = resume_count
+            self.file = open(path, 'ab')
+        else:
+            self.file = open(path, 'wb')
+
+    def load(self):
+        """读取已记录的键"""
+        self.file.flush()
+        return np.fromfile(self.path, dtype='<i8', count=self.count).tolist()
+
+    def append(self, keys):
+        if keys:
+            np.asarray(keys, dtype='<i8').tofile(self.file)
+            self.count += len(keys)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Reservoir:
+    """
+    单遍蓄水池抽样（Algorithm L）: 从未知长度的数据流中等概率抽取 size 个元素，
+    内存只与 size 有关；按几何分布直接算出下一个入选的位置，
+    被跳过的元素不需要编码，只需计数
+
+    用法: slot = reservoir.offer()，不为None时把新元素写入 reservoir.items[slot]
+    """
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.items = []
+        self.seen = 0
+        self._w = 1.0
+        self._next = size
+        if size:
+            self._w = math.exp(math.log(self._random()) / size)
+            self._next = size + self._skip()
+
+    def _random(self):
+        # (0, 1) 区间，避免 log(0)
+        return self.rng.random() or 1e-300
+
+    def _skip(self):
+        return int(math.log(self._random()) / math.log(1.0 - self._w))
+
+    def offer(self):
+        """登记一个新元素，返回它应写入的位置（None表示不入选）"""
+        index = self.seen
+        self.seen += 1
+        if index < self.size:
+            self.items.append(None)
+            return index
+        if index < self._next:
+            return None
+        self._w *= math.exp(math.log(self._random()) / self.size)
+        self._next = index + 1 + self._skip()
+        return self.rng.randrange(self.size)
+
+
+class StratifiedReservoir:
+    """
+    分层蓄水池抽样: 每个层（如对局阶段）一个独立的蓄水池，
+    weights 为各层占样本总数的比例；不在 weights 中的层不抽样
+    """
+
+    def __init__(self, size, weights, seed=42):
+        rng = random.Random(seed)
+        total = sum(weights.values())
+        self.reservoirs = {stratum: Reservoir(round(size * weight / total), rng)
+                           for stratum, weight in weights.items()}
+
+    def offer(self, stratum):
+        """返回 (层, 位置)，不入选时为None"""
+        reservoir = self.reservoirs.get(stratum)
+        if reservoir is None:
+            return None
+        slot = reservoir.offer()
+        return None if slot is None else (stratum, slot)
+
+    def put(self, key, item):
+        stratum, slot = key
+        self.reservoirs[stratum].items[slot] = item
+
+    @property
+    def items(self):
+        return [item for reservoir in self.reservoirs.values() for item in reservoir.items]
+
+    @property
+    def seen(self):
+        return sum(reservoir.seen for reservoir in self.reservoirs.values())
+
+    def report(self):
+        for stratum, reservoir in self.reservoirs.items():
+            print(f"  {stratum}: 抽取 {len(reservoir.items)} / {reservoir.seen}")
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+测试 generate_evaluations.ActiveLabeler 的 disagreement 打分
+模型输出与浅搜索结果必须换算到相同的视角和刻度后比较: 模型完全复现浅搜索的训练目标时，
+每个位置的估计误差应为0
+用假模型和假的浅搜索引擎池代替 TensorFlow 和 Stockfish（只需要python-chess）
+
+运行: python -m pytest test_active_labeler.py
+"""
+
+import random
+
+import chess
+import numpy as np
+
+import generate_evaluations as ge
+from board_encoder import board_to_packed, unpack_bitboards
+from dataset_io import eval_to_target
+
+# 兵、马、象、车、后、王，顺序与位棋盘平面一致
+PIECE_VALUES = np.array([100, 300, 300, 500, 900, 0])
+
+
+def material(planes):
+    """白方视角的子力差（cp）"""
+    counts = planes.sum(axis=(1, 2))
+    return counts[:, :6] @ PIECE_VALUES - counts[:, 6:] @ PIECE_VALUES
+
+
+class FakeModel:
+    """输出浅搜索结果编码后的训练目标（白方视角）"""
+
+    def predict(self, planes, batch_size=None, verbose=0):
+        evals = [ge.score_to_eval({'score': cp, 'score_type': 'cp'}) for cp in material(planes)]
+        return eval_to_target(evals).reshape(-1, 1)
+
+
+class FakeShallowPool:
+    """浅搜索: 当前走棋方视角的子力差（与UCI分数相同）"""
+
+    def evaluate_games(self, games):
+        for game_data in games:
+            evals = []
+            for fen, _, board_bits, _ in game_data['positions']:
+                cp = int(material(unpack_bitboards(board_bits[None]))[0])
+                evals.append({'score': cp if ge.white_to_move(fen) else -cp, 'score_type': 'cp'})
+            yield game_data, evals
+
+
+def make_games(num_games=4, plies=40, seed=0):
+    rng = random.Random(seed)
+    games = []
+    for _ in range(num_games):
+        board = chess.Board()
+        positions = []
+        for _ in range(plies):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            # 优先吃子，让子力差偏离0
+            captures = [move for move in moves if board.is_capture(move)]
+            move = rng.choice(captures or moves)
+            positions.append((board.fen(), move.uci(), board_to_packed(board), None))
+            board.push(move)
+        games.append({'positions': positions})
+    return games
+
+
+def test_disagreement_is_zero_when_model_matches_shallow_search():
+    games = make_games()
+    labeler = ge.ActiveLabeler(mode='disagreement')
+    labeler.model = FakeModel()
+    labeler.shallow_pool = FakeShallowPool()
+    candidates = [(g, i) for g, game_data in enumerate(games)
+                  for i in range(len(game_data['positions']))]
+
+    scores = labeler.score(games, candidates)
+
+    # 确认样本中有子力不平衡的位置，两种视角都出现
+    planes = unpack_bitboards(np.stack([games[g]['positions'][i][2] for g, i in candidates]))
+    assert np.any(material(planes) != 0)
+    assert len(scores) == len(candidates)
+    np.testing.assert_allclose(scores, 0.0, atol=1e-6)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+测试 generate_evaluations.AdaptiveDepth 的校准
+校准搜索必须在 ucinewgame 之后进行（不复用本位置浅/中搜索留在置换表中的结果），
+其耗时单独统计，不计入自适应标注的引擎时间
+用记录调用顺序的假搜索代替引擎（不需要Stockfish）
+
+运行: python -m pytest test_adaptive_depth.py
+"""
+
+import asyncio
+
+import generate_evaluations as ge
+
+
+class FakeEngine:
+    """记录搜索和 ucinewgame 的顺序，浅搜索与中等深度搜索的分数由 disagree 决定是否一致"""
+
+    def __init__(self, disagree=False):
+        self.disagree = disagree
+        self.calls = []
+
+    async def search(self, depth=None, nodes=None):
+        self.calls.append(depth)
+        cp = 500 if self.disagree and depth == 8 else 0
+        return {'score': cp, 'score_type': 'cp', 'depth': depth, 'nodes': 10 * depth}
+
+    async def new_game(self):
+        self.calls.append('ucinewgame')
+
+
+def analyse_all(adaptive, engine, positions):
+    async def run():
+        return [await adaptive.analyse(engine.search, engine.new_game) for _ in range(positions)]
+    return asyncio.run(run())
+
+
+def test_calibration_searches_from_new_game():
+    adaptive = ge.AdaptiveDepth(shallow={'depth': 8}, medium=12, deep=18, calibrate_every=2)
+    engine = FakeEngine()
+    infos = analyse_all(adaptive, engine, 4)
+
+    # 第2、4个位置在自适应搜索之后先发送 ucinewgame，再做固定深度的校准搜索
+    assert engine.calls == [8, 12, 8, 12, 'ucinewgame', 18, 8, 12, 8, 12, 'ucinewgame', 18]
+    # 校准搜索的结果不用作标签，节点数也不计入
+    assert all(info['depth'] == 12 and info['nodes'] == 200 for info in infos)
+    assert adaptive.stats['calibrated'] == 2
+    assert adaptive.stats['researched'] == 0
+
+
+def test_research_uses_deep_result():
+    adaptive = ge.AdaptiveDepth(shallow={'depth': 8}, medium=12, deep=18, calibrate_every=0)
+    engine = FakeEngine(disagree=True)
+    info, = analyse_all(adaptive, engine, 1)
+
+    assert engine.calls == [8, 12, 18]
+    assert info['depth'] == 18 and info['nodes'] == 380
+    assert adaptive.stats['researched'] == 1
+
+
+def test_calibration_time_excluded_from_engine_time():
+    adaptive = ge.AdaptiveDepth(shallow={'depth': 8}, medium=12, deep=18, calibrate_every=1)
+    engine = FakeEngine()
+    search = engine.search
+
+    async def slow_deep_search(depth=None, nodes=None):
+        if depth == 18:
+            await asyncio.sleep(0.2)
+        return await search(depth=depth, nodes=nodes)
+
+    engine.search = slow_deep_search
+    analyse_all(adaptive, engine, 2)
+
+    assert adaptive.stats['calibration_time'] >= 0.4
+    assert adaptive.stats['time'] < 0.1
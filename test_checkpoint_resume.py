@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+测试 generate_evaluations 的检查点继续功能
+在对局写到一半或两局之间等待时模拟 Ctrl-C，然后 resume=True 继续运行，
+输出必须与一次性运行的结果完全相同，且已写完的对局不会重新评估
+出错时同样保存检查点并停止引擎，Ctrl-C 不需要等待正在搜索的对局
+用一个确定性的假UCI引擎代替Stockfish（只需要python-chess）
+
+运行: python -m pytest test_checkpoint_resume.py
+"""
+
+import os
+import random
+import stat
+import sys
+import time
+
+import chess
+import chess.pgn
+import pytest
+
+import generate_evaluations as ge
+from dataset_io import iter_samples
+from pipeline import Pipeline
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason="假引擎脚本需要可执行的shebang")
+
+NUM_GAMES = 12
+PLIES_PER_GAME = 16
+
+# 确定性的假引擎: 分数为走棋方视角的子力差，按要求的深度回复（环境变量 FAKE_DELAY 秒之后）
+FAKE_ENGINE = '''\
+import os
+import sys
+import time
+import chess
+
+DELAY = float(os.environ.get('FAKE_DELAY', 0))
+
+VALUES = {1: 100, 2: 300, 3: 300, 4: 500, 5: 900, 6: 0}
+board = chess.Board()
+for line in sys.stdin:
+    tokens = line.split()
+    if not tokens:
+        continue
+    command = tokens[0]
+    if command == 'uci':
+        print('id name fake', flush=True)
+        print('uciok', flush=True)
+    elif command == 'isready':
+        print('readyok', flush=True)
+    elif command == 'quit':
+        break
+    elif command == 'position':
+        if tokens[1] == 'startpos':
+            board = chess.Board()
+            rest = tokens[2:]
+        else:
+            end = tokens.index('moves') if 'moves' in tokens else len(tokens)
+            board = chess.Board(' '.join(tokens[2:end]))
+            rest = tokens[end:]
+        for move in rest[1:]:
+            board.push_uci(move)
+    elif command == 'go':
+        time.sleep(DELAY)
+        depth = int(tokens[tokens.index('depth') + 1]) if 'depth' in tokens else 10
+        score = sum((1 if piece.color == board.turn else -1) * VALUES[piece.piece_type]
+                    for piece in board.piece_map().values())
+        print(f'info depth {depth} score cp {score} nodes {100 * depth} pv 0000', flush=True)
+        move = next(iter(board.legal_moves), None)
+        print(f'bestmove {move.uci() if move else "(none)"}', flush=True)
+'''
+
+
+class InterruptingWriter:
+    """包装写入器，写入第 interrupt_at 个样本时抛出 error（默认 KeyboardInterrupt，模拟Ctrl-C）"""
+
+    def __init__(self, writer, interrupt_at, error=KeyboardInterrupt):
+        self.writer = writer
+        self.interrupt_at = interrupt_at
+        self.error = error
+        self.written = 0
+
+    def write(self, sample):
+        if self.written == self.interrupt_at:
+            raise self.error
+        self.written += 1
+        self.writer.write(sample)
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+
+@pytest.fixture
+def workdir(tmp_path):
+    rng = random.Random(0)
+    with open(tmp_path / 'games.pgn', 'w', encoding='utf-8') as f:
+        for i in range(NUM_GAMES):
+            game = chess.pgn.Game()
+            game.headers['Event'] = f'Game {i}'
+            game.headers['Result'] = rng.choice(['1-0', '0-1', '1/2-1/2'])
+            node = game
+            for _ in range(PLIES_PER_GAME):
+                moves = list(node.board().legal_moves)
+                if not moves:
+                    break
+                node = node.add_variation(rng.choice(moves))
+            print(game, file=f, end='\n\n')
+
+    engine = tmp_path / 'fake_engine.py'
+    engine.write_text(f'#!{sys.executable}\n' + FAKE_ENGINE, encoding='utf-8')
+    engine.chmod(engine.stat().st_mode | stat.S_IEXEC)
+    return tmp_path
+
+
+def run(workdir, output, interrupt_at=None, interrupt_after_games=None, error=KeyboardInterrupt,
+        **kwargs):
+    """
+    运行一次 process_pgn_file，返回送入引擎的位置数
+    interrupt_at: 写入本次运行的第N个样本时抛出 error（对局写到一半）
+    interrupt_after_games: 本次运行写完N局后、等待下一局时中断（写入阶段空闲）
+    """
+    create_writer = ge.create_writer
+    searched = []
+    evaluate_games = ge.StockfishPool.evaluate_games
+    consume = Pipeline.consume
+
+    def interrupting_consume(pipeline, name, stage):
+        for games, item in enumerate(consume(pipeline, name, stage), 1):
+            yield item
+            if games == interrupt_after_games:
+                raise KeyboardInterrupt
+
+    def counting_evaluate_games(pool, game_iter, **kwargs):
+        for game_data, evals in evaluate_games(pool, game_iter, **kwargs):
+            searched.append(len(game_data['positions']))
+            yield game_data, evals
+
+    def interrupting_create_writer(*args, **writer_kwargs):
+        return InterruptingWriter(create_writer(*args, **writer_kwargs), interrupt_at, error)
+
+    ge.StockfishPool.evaluate_games = counting_evaluate_games
+    if interrupt_at is not None:
+        ge.create_writer = interrupting_create_writer
+    if interrupt_after_games is not None:
+        Pipeline.consume = interrupting_consume
+    try:
+        ge.process_pgn_file(str(workdir / 'games.pgn'), str(workdir / output),
+                            max_positions_per_game=8, stockfish_path=str(workdir / 'fake_engine.py'),
+                            engine_depth=4, resume=True, checkpoint_every=1000, **kwargs)
+    finally:
+        ge.create_writer = create_writer
+        Pipeline.consume = consume
+        ge.StockfishPool.evaluate_games = evaluate_games
+    return sum(searched)
+
+
+@pytest.mark.parametrize('output', ['out_shards', 'out.json'])
+@pytest.mark.parametrize('options', [{}, {'use_index': True}], ids=['offset', 'index'])
+def test_resume_matches_uninterrupted_run(workdir, output, options):
+    """多次中断后继续运行，输出与一次性运行相同"""
+    reference = 'reference_' + output
+    run(workdir, reference, **options)
+    expected = list(iter_samples(str(workdir / reference)))
+    assert len(expected) == NUM_GAMES * 8
+
+    # 对局写到一半（第3局的第5个样本）、对局边界（第5局开始写时）、两局之间等待时各中断一次
+    for interrupt in ({'interrupt_at': 20}, {'interrupt_at': 16}, {'interrupt_after_games': 3}):
+        run(workdir, output, **interrupt, **options)
+        assert os.path.exists(str(workdir / output).rstrip('/') + '.ckpt')
+    run(workdir, output, **options)
+
+    assert list(iter_samples(str(workdir / output))) == expected
+
+
+@pytest.mark.parametrize('interrupt', [{'interrupt_at': 20}, {'interrupt_after_games': 2}],
+                         ids=['mid-game', 'between-games'])
+def test_resume_skips_written_games(workdir, interrupt):
+    """中断时已写完的对局不会重新送入引擎"""
+    run(workdir, 'out_shards', **interrupt)
+    resumed = run(workdir, 'out_shards')
+    # 中断时前2局（16个位置）已写完，继续运行只评估剩下的10局
+    assert resumed == (NUM_GAMES - 2) * 8
+
+
+def test_error_saves_checkpoint_and_stops_engines(workdir):
+    """KeyboardInterrupt 以外的异常同样保存检查点、停止引擎后继续抛出，之后可以继续运行"""
+    run(workdir, 'reference_shards')
+    expected = list(iter_samples(str(workdir / 'reference_shards')))
+
+    stopped = []
+    stop = ge.StockfishPool.stop
+
+    def recording_stop(pool):
+        stopped.append(pool.loop is not None)
+        stop(pool)
+
+    ge.StockfishPool.stop = recording_stop
+    try:
+        with pytest.raises(OSError):
+            run(workdir, 'out_shards', interrupt_at=20, error=OSError("disk full"))
+    finally:
+        ge.StockfishPool.stop = stop
+    assert stopped == [True]
+    assert os.path.exists(str(workdir / 'out_shards.ckpt'))
+
+    assert run(workdir, 'out_shards') == (NUM_GAMES - 2) * 8
+    assert list(iter_samples(str(workdir / 'out_shards'))) == expected
+
+
+def test_interrupt_does_not_wait_for_label_stage(workdir, monkeypatch):
+    """写入阶段中断时，阻塞在等待引擎结果上的标注阶段随流水线关闭立即结束"""
+    monkeypatch.setenv('FAKE_DELAY', '0.5')
+    closes = []
+    close = Pipeline.close
+
+    def timed_close(pipeline, timeout=5):
+        start = time.perf_counter()
+        close(pipeline, timeout)
+        alive = [stage.thread.is_alive() for stage in pipeline.stages]
+        closes.append((time.perf_counter() - start, alive))
+
+    monkeypatch.setattr(Pipeline, 'close', timed_close)
+    run(workdir, 'out_shards', interrupt_after_games=1)
+    elapsed, alive = closes[0]
+    assert not any(alive)
+    assert elapsed < 2
@@ -9,6 +9,8 @@ import tensorflow as tf
 from tensorflow import keras
 import chess
 
+from board_encoder import fen_to_tensor
+
 def load_model(model_path):
     """加载训练好的模型"""
     print(f"正在加载模型: {model_path}")
@@ -17,26 +19,6 @@ def load_model(model_path):
     print(f"  参数数量: {model.count_params():,}")
     return model
 
-def fen_to_tensor(fen):
-    """将FEN字符串转换为8x8x12的张量"""
-    board = chess.Board(fen)
-    tensor = np.zeros((8, 8, 12), dtype=np.float32)
-
-    piece_to_index = {
-        'P': 0, 'N': 1, 'B': 2, 'R': 3, 'Q': 4, 'K': 5,
-        'p': 6, 'n': 7, 'b': 8, 'r': 9, 'q': 10, 'k': 11
-    }
-
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if piece:
-            row = square // 8
-            col = square % 8
-            piece_char = piece.symbol()
-            tensor[row, col, piece_to_index[piece_char]] = 1.0
-
-    return tensor
-
 def evaluate_position(model, fen):
     """评估棋盘位置"""
     tensor = fen_to_tensor(fen)
@@ -10,19 +10,136 @@ import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras import layers
 from sklearn.model_selection import train_test_split
+import hashlib
 import os
+import shutil
+import time
+
+from board_encoder import NUM_PLANES, flip_bitboards, pack_planes, unpack_bitboards
+from dataset_io import ShardedDataset, eval_to_target, is_shard_dataset
+from dataset_tf import StepRateLogger, benchmark_input, make_dataset
+
+# int8量化: 校准激活值范围的代表性样本数、比较精度的验证样本数、允许的MAE增加量（目标范围[-1, 1]）
+QUANT_CALIBRATION_SAMPLES = 500
+QUANT_EVAL_SAMPLES = 2000
+QUANT_MAX_MAE_DELTA = 0.01
+
+# 模型结构变体（见 build_model 和 model_sweep.py）:
+#   channels: 各卷积层的通道数，separable: 第一层之后用深度可分离卷积，
+#   dense/dropout: 全连接层的单元数和之后的Dropout比例
+MODEL_VARIANTS = {
+    'baseline': {'channels': (32, 64, 64, 128), 'separable': False, 'dense': (128, 64), 'dropout': (0.3, 0.2)},
+    'half': {'channels': (16, 32, 32, 64), 'dense': (64, 32)},
+    'quarter': {'channels': (8, 16, 16, 32), 'dense': (32, 16)},
+    'separable': {'separable': True},
+    'separable_half': {'channels': (16, 32, 32, 64), 'separable': True, 'dense': (64, 32)},
+    'shallow': {'channels': (32, 64), 'dense': (64,), 'dropout': (0.2,)},
+}
+
+# 每字节的C字面量（分块生成头文件时查表，避免逐字节格式化）
+HEX_BYTES = [f'0x{b:02x}, ' for b in range(256)]
+HEADER_BYTES_PER_LINE = 16
+HEADER_CHUNK_SIZE = 64 * 1024
+
+MODEL_DECLARATIONS = """
+#ifndef CHESS_MODEL_H
+#define CHESS_MODEL_H
+
+// Defined in chess_model_data.S (.incbin "chess_model.bin")
+#ifdef __cplusplus
+extern "C" {
+#endif
+extern const unsigned char chess_model_tflite[];
+extern const int chess_model_tflite_len;
+#ifdef __cplusplus
+}
+#endif
+
+#endif // CHESS_MODEL_H
+"""
+
+# TFLite要求模型数据16字节对齐
+MODEL_ASM = """
+    .section .rodata.chess_model, "a"
+    .global chess_model_tflite
+    .global chess_model_tflite_len
+
+    .balign 16
+chess_model_tflite:
+    .incbin "chess_model.bin"
+chess_model_tflite_end:
+
+    .balign 4
+chess_model_tflite_len:
+    .4byte chess_model_tflite_end - chess_model_tflite
+"""
+
+
+class PackedBoardSequence(keras.utils.Sequence):
+    """
+    按批次把压缩的位棋盘展开为8x8x12浮点平面，内存中只保留 (N, 12) 的uint64
+    bitboards 可以是数组或分片数据集的内存映射视图，indices 为本序列使用的样本下标
+    augment: 每个样本以50%概率做颜色翻转（在压缩的位棋盘上完成，见 board_encoder.flip_bitboards）
+    """
+
+    def __init__(self, bitboards, y, batch_size, indices=None, shuffle=False, seed=42, augment=False,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.bitboards = bitboards
+        self.y = y
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.augment = augment
+        self.rng = np.random.default_rng(seed)
+        self.order = np.arange(len(bitboards)) if indices is None else np.array(indices)
+        self.batch_planes = np.empty((batch_size, 8, 8, NUM_PLANES), dtype=np.float32)
+        self.on_epoch_end()
+
+    def __len__(self):
+        return (len(self.order) + self.batch_size - 1) // self.batch_size
+
+    def __getitem__(self, index):
+        # 批内按下标排序，内存映射读取更连续
+        batch_index = np.sort(self.order[index * self.batch_size:(index + 1) * self.batch_size])
+        bitboards = self.bitboards[batch_index]
+        y = self.y[batch_index]
+        if self.augment:
+            flip = self.rng.random(len(batch_index)) < 0.5
+            bitboards = np.where(flip[:, None], flip_bitboards(bitboards), bitboards)
+            y = np.where(flip, -y, y)
+        planes = unpack_bitboards(bitboards, self.batch_planes)
+        return planes[:len(batch_index)].copy(), y
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.rng.shuffle(self.order)
 
 
 class ChessModelTrainer:
-    def __init__(self, data_file, model_dir='models'):
+    def __init__(self, data_file, model_dir='models', variant='baseline'):
         self.data_file = data_file
         self.model_dir = model_dir
+        self.variant = variant
+        self.quantization_stats = None
         os.makedirs(model_dir, exist_ok=True)
 
     def load_data(self, max_samples=None):
-        """加载训练数据"""
+        """
+        加载训练数据
+        棋盘保持压缩形式返回: X 为 (N, 12) 的uint64位棋盘，
+        二进制分片数据集以内存映射方式打开（X 为按需读取的视图），
+        同时兼容JSON格式（包括 board_state 为8x8x12浮点列表的旧格式）
+        """
         print(f"正在加载数据: {self.data_file}")
 
+        if is_shard_dataset(self.data_file):
+            dataset = ShardedDataset(self.data_file)
+            X = dataset.column('board_bits', max_samples)
+            print(f"加载了 {len(X)} 个样本")
+            y_eval = dataset.take('eval', np.arange(len(X)))
+            y_result = dataset.take('result', np.arange(len(X)))
+            return X, y_eval, y_result
+
         with open(self.data_file, 'r', encoding='utf-8') as f:
             data = json.load(f)
 
@@ -32,7 +149,12 @@ class ChessModelTrainer:
         print(f"加载了 {len(data)} 个样本")
 
         # 提取特征和标签
-        X = np.array([sample['board_state'] for sample in data], dtype=np.float32)
+        X = np.empty((len(data), NUM_PLANES), dtype=np.uint64)
+        for i, sample in enumerate(data):
+            if 'board_bits' in sample:
+                X[i] = sample['board_bits']
+            else:
+                X[i] = pack_planes(sample['board_state'])[0]
         y_eval = np.array([sample['eval'] for sample in data], dtype=np.float32)
         y_result = np.array([sample['result'] for sample in data], dtype=np.float32)
 
@@ -43,28 +165,31 @@ class ChessModelTrainer:
         构建轻量级CNN模型（适合ESP32部署）
         输入: 8x8x12 棋盘状态
         输出: 评估值 (-1到1之间)
+        结构由 self.variant（MODEL_VARIANTS 中的名称或配置字典）决定，默认 'baseline'
         """
+        config = dict(MODEL_VARIANTS['baseline'])
+        config.update(MODEL_VARIANTS[self.variant] if isinstance(self.variant, str) else self.variant)
+        channels = config['channels']
+
         inputs = keras.Input(shape=(8, 8, 12), name='board_input')
 
-        # 卷积层 - 提取棋盘特征
-        x = layers.Conv2D(32, 3, activation='relu', padding='same')(inputs)
-        x = layers.BatchNormalization()(x)
-        x = layers.Conv2D(64, 3, activation='relu', padding='same')(x)
-        x = layers.BatchNormalization()(x)
-        x = layers.MaxPooling2D(2)(x)
-
-        # 更深层的特征提取
-        x = layers.Conv2D(64, 3, activation='relu', padding='same')(x)
-        x = layers.BatchNormalization()(x)
-        x = layers.Conv2D(128, 3, activation='relu', padding='same')(x)
-        x = layers.BatchNormalization()(x)
+        # 卷积层 - 提取棋盘特征（第一层始终是普通卷积，12个输入平面做深度可分离卷积意义不大）
+        x = inputs
+        for i, filters in enumerate(channels):
+            if i > 0 and config['separable']:
+                x = layers.SeparableConv2D(filters, 3, activation='relu', padding='same')(x)
+            else:
+                x = layers.Conv2D(filters, 3, activation='relu', padding='same')(x)
+            x = layers.BatchNormalization()(x)
+            # 前两层之后池化到4x4，更深层的特征提取在4x4上进行
+            if i == 1 and len(channels) > 2:
+                x = layers.MaxPooling2D(2)(x)
         x = layers.GlobalAveragePooling2D()(x)
 
         # 全连接层
-        x = layers.Dense(128, activation='relu')(x)
-        x = layers.Dropout(0.3)(x)
-        x = layers.Dense(64, activation='relu')(x)
-        x = layers.Dropout(0.2)(x)
+        for units, rate in zip(config['dense'], config['dropout']):
+            x = layers.Dense(units, activation='relu')(x)
+            x = layers.Dropout(rate)(x)
 
         # 输出层 - 评估值 (-1到1)
         outputs = layers.Dense(1, activation='tanh')(x)
@@ -73,25 +198,65 @@ class ChessModelTrainer:
 
         return model
 
-    def train(self, epochs=50, batch_size=64, max_samples=50000):
-        """训练模型"""
+    def train(self, epochs=50, batch_size=64, max_samples=50000, streaming=False,
+              val_fraction=0.2, shuffle_buffer=100000, augment=False):
+        """
+        训练模型
+        streaming=True 时（需要二进制分片数据集）用 tf.data 直接从分片文件流式读取（见 dataset_tf），
+        数据不载入内存；验证集按对局编号确定性划分（同一局的样本不会同时出现在训练集和验证集），
+        每轮打印训练的 steps/sec，并与输入管线单独的速度比较
+        augment=True 时训练批次中的样本随机做颜色翻转（上下镜像、交换黑白、评估值取反），
+        相当于训练数据翻倍，而不增加磁盘数据和内存；验证集不翻转
+        """
+        if streaming:
+            if is_shard_dataset(self.data_file):
+                return self._train_streaming(epochs, batch_size, max_samples, val_fraction, shuffle_buffer,
+                                             augment)
+            print("流式训练需要二进制分片数据集，改为载入内存训练")
+
         # 加载数据
         X, y_eval, y_result = self.load_data(max_samples)
 
+        y = self._targets(y_eval, y_result)
+
+        # 划分训练集和验证集（只划分下标，不复制棋盘数据）
+        train_index, val_index = train_test_split(
+            np.arange(len(X)), test_size=0.2, random_state=42
+        )
+
+        print(f"训练集: {len(train_index)} 样本")
+        print(f"验证集: {len(val_index)} 样本")
+
+        # 训练时按批次展开位棋盘
+        train_data = PackedBoardSequence(X, y, batch_size, train_index, shuffle=True, augment=augment)
+        val_data = PackedBoardSequence(X, y, batch_size, val_index)
+
+        model = self._compiled_model()
+        return self._fit(model, train_data, val_data, epochs)
+
+    @staticmethod
+    def _targets(y_eval, y_result):
         # 使用评估值作为训练目标（如果有），否则使用结果
         y = np.where(np.abs(y_eval) > 0.01, y_eval, y_result)
 
         # 归一化评估值到 -1 到 1
-        y = np.clip(y / 10.0, -1, 1)
+        return eval_to_target(y)
 
-        # 划分训练集和验证集
-        X_train, X_val, y_train, y_val = train_test_split(
-            X, y, test_size=0.2, random_state=42
-        )
+    def _train_streaming(self, epochs, batch_size, max_samples, val_fraction, shuffle_buffer, augment):
+        print(f"流式读取数据: {self.data_file}")
+        train_data = make_dataset(self.data_file, 'train', batch_size, val_fraction, max_samples,
+                                  shuffle_buffer, augment=augment)
+        val_data = make_dataset(self.data_file, 'val', batch_size, val_fraction, max_samples)
+        print(f"验证集: 按对局划分 {val_fraction:.0%}")
+
+        input_rate = benchmark_input(train_data)
+        print(f"输入管线: {input_rate:.1f} steps/sec（批大小 {batch_size}）")
 
-        print(f"训练集: {X_train.shape[0]} 样本")
-        print(f"验证集: {X_val.shape[0]} 样本")
+        model = self._compiled_model()
+        return self._fit(model, train_data, val_data, epochs,
+                         [StepRateLogger(batch_size, input_rate)])
 
+    def _compiled_model(self):
         # 构建模型
         model = self.build_model()
 
@@ -104,9 +269,11 @@ class ChessModelTrainer:
 
         # 打印模型结构
         model.summary()
+        return model
 
+    def _fit(self, model, train_data, val_data, epochs, extra_callbacks=()):
         # 训练回调
-        callbacks = [
+        callbacks = list(extra_callbacks) + [
             keras.callbacks.EarlyStopping(
                 monitor='val_loss',
                 patience=10,
@@ -127,10 +294,9 @@ class ChessModelTrainer:
 
         # 训练模型
         history = model.fit(
-            X_train, y_train,
-            validation_data=(X_val, y_val),
+            train_data,
+            validation_data=val_data,
             epochs=epochs,
-            batch_size=batch_size,
             callbacks=callbacks,
             verbose=1
         )
@@ -141,14 +307,74 @@ class ChessModelTrainer:
         print(f"\n模型已保存到: {model_path}")
 
         # 评估模型
-        val_loss, val_mae = model.evaluate(X_val, y_val, verbose=0)
+        val_loss, val_mae = model.evaluate(val_data, verbose=0)
         print(f"验证集损失: {val_loss:.4f}")
         print(f"验证集平均绝对误差: {val_mae:.4f}")
 
         return model, history
 
-    def convert_to_tflite(self, model_path, quantize=True):
-        """将模型转换为TensorFlow Lite格式（适合ESP32）"""
+    def _quantization_data(self, max_samples, calibration_samples, eval_samples):
+        """
+        量化用的数据: 代表性数据取自训练集，评估数据取自验证集（与 train 的划分相同）
+        返回 (代表性平面, 评估平面, 评估目标)，均为numpy数组
+        """
+        if is_shard_dataset(self.data_file):
+            def take(split, count, shuffle_buffer=0):
+                dataset = make_dataset(self.data_file, split, count, max_samples=max_samples,
+                                       shuffle_buffer=shuffle_buffer)
+                x, y = next(iter(dataset))
+                return x.numpy(), y.numpy()
+
+            calibration, _ = take('train', calibration_samples, shuffle_buffer=10 * calibration_samples)
+            x_eval, y_eval = take('val', eval_samples)
+            return calibration, x_eval, y_eval
+
+        X, y_eval, y_result = self.load_data(max_samples)
+        y = self._targets(y_eval, y_result)
+        train_index, val_index = train_test_split(np.arange(len(X)), test_size=0.2, random_state=42)
+        val_index = val_index[:eval_samples]
+        return (unpack_bitboards(X[train_index[:calibration_samples]]),
+                unpack_bitboards(X[val_index]), y[val_index])
+
+    @staticmethod
+    def _run_tflite(tflite_model, x):
+        """
+        用主机端TFLite解释器逐个局面推理（与固件相同，批大小为1）
+        返回 (评估值数组, 每次推理的平均毫秒数)；int8输入输出按模型的量化参数转换
+        """
+        interpreter = tf.lite.Interpreter(model_content=tflite_model)
+        interpreter.allocate_tensors()
+        input_detail = interpreter.get_input_details()[0]
+        output_detail = interpreter.get_output_details()[0]
+
+        if input_detail['dtype'] == np.int8:
+            scale, zero_point = input_detail['quantization']
+            x = np.clip(np.round(x / scale) + zero_point, -128, 127).astype(np.int8)
+
+        outputs = np.empty(len(x), dtype=np.float32)
+        start = time.perf_counter()
+        for i in range(len(x)):
+            interpreter.set_tensor(input_detail['index'], x[i:i + 1])
+            interpreter.invoke()
+            outputs[i] = interpreter.get_tensor(output_detail['index']).reshape(-1)[0]
+        elapsed = time.perf_counter() - start
+
+        if output_detail['dtype'] == np.int8:
+            scale, zero_point = output_detail['quantization']
+            outputs = (outputs - zero_point) * scale
+        return outputs, 1000.0 * elapsed / max(len(x), 1)
+
+    def convert_to_tflite(self, model_path, quantize=True, max_samples=50000,
+                          calibration_samples=QUANT_CALIBRATION_SAMPLES, eval_samples=QUANT_EVAL_SAMPLES,
+                          max_mae_delta=QUANT_MAX_MAE_DELTA, header_mode='header'):
+        """
+        将模型转换为TensorFlow Lite格式（适合ESP32）
+        总是生成float32模型；quantize=True 时另外生成全整数int8模型（权重、激活和输入输出都是int8，
+        固件可以使用ESP-NN的int8内核），激活值范围用训练集中的 calibration_samples 个局面校准
+        在验证集的 eval_samples 个局面上比较两个模型的大小、主机端推理延迟和平均绝对误差，
+        int8模型的MAE比float32模型增加不超过 max_mae_delta 时，C头文件使用int8模型，否则使用float32模型
+        header_mode: 固件文件的输出方式（见 tflite_to_c_header）
+        """
         print(f"\n正在转换模型为TFLite格式...")
 
         # 加载模型
@@ -157,8 +383,7 @@ class ChessModelTrainer:
         # 转换为TFLite
         converter = tf.lite.TFLiteConverter.from_keras_model(model)
 
-        # 不使用量化优化，保持纯float32格式以兼容TFLite Micro
-        # TFLite Micro不支持混合精度模型
+        # float32模型不使用量化优化（TFLite Micro不支持混合精度模型）
         converter.optimizations = []
 
         tflite_model = converter.convert()
@@ -177,46 +402,164 @@ class ChessModelTrainer:
         print(f"TFLite模型大小: {tflite_size:.2f} MB")
         print(f"压缩率: {(1 - tflite_size/original_size)*100:.1f}%")
 
-        # 转换为C数组头文件（ESP32使用）
-        self.tflite_to_c_header(tflite_path)
-
-        return tflite_path
-
-    def tflite_to_c_header(self, tflite_path):
-        """将TFLite模型转换为C数组头文件"""
-        import binascii
+        self.quantization_stats = None
+        header_model = tflite_path
+        if quantize:
+            int8_path = self._quantize_int8(model, tflite_model, max_samples, calibration_samples,
+                                            eval_samples, max_mae_delta)
+            if int8_path:
+                header_model = int8_path
 
-        with open(tflite_path, 'rb') as f:
-            model_data = f.read()
+        # 转换为C数组头文件（ESP32使用）
+        self.tflite_to_c_header(header_model, header_mode)
 
-        hex_data = ', '.join(f'0x{b:02x}' for b in model_data)
+        return header_model
 
-        header_content = f"""// Chess AI Model for ESP32
-// Auto-generated TFLite model
-// Size: {len(model_data)} bytes
+    def _quantize_int8(self, model, float_model, max_samples, calibration_samples, eval_samples,
+                       max_mae_delta):
+        """生成int8模型并与float32模型比较，通过精度检查时返回int8模型路径，否则返回None"""
+        print(f"\n正在生成int8量化模型（校准样本 {calibration_samples}）...")
+        calibration, x_eval, y_eval = self._quantization_data(max_samples, calibration_samples,
+                                                              eval_samples)
 
-#ifndef CHESS_MODEL_H
-#define CHESS_MODEL_H
+        def representative_dataset():
+            for i in range(len(calibration)):
+                yield [calibration[i:i + 1]]
 
-const unsigned char chess_model_tflite[] = {{
-    {hex_data}
-}};
-
-const int chess_model_tflite_len = {len(model_data)};
-
-#endif // CHESS_MODEL_H
-"""
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+        int8_model = converter.convert()
+
+        int8_path = os.path.join(self.model_dir, 'chess_ai_model_int8.tflite')
+        with open(int8_path, 'wb') as f:
+            f.write(int8_model)
+        print(f"int8模型已保存到: {int8_path}")
+
+        float_pred, float_ms = self._run_tflite(float_model, x_eval)
+        int8_pred, int8_ms = self._run_tflite(int8_model, x_eval)
+        float_mae = float(np.mean(np.abs(float_pred - y_eval)))
+        int8_mae = float(np.mean(np.abs(int8_pred - y_eval)))
+        drift = np.abs(int8_pred - float_pred)
+
+        print(f"\n量化对比（验证集 {len(x_eval)} 个局面，主机端逐个推理）:")
+        print(f"  {'':8s} {'大小':>10s} {'延迟':>10s} {'MAE':>8s}")
+        print(f"  {'float32':8s} {len(float_model) / 1024:8.1f}KB {float_ms:8.3f}ms {float_mae:8.4f}")
+        print(f"  {'int8':8s} {len(int8_model) / 1024:8.1f}KB {int8_ms:8.3f}ms {int8_mae:8.4f}")
+        print(f"  大小减少 {1 - len(int8_model) / len(float_model):.1%}，"
+              f"MAE变化 {int8_mae - float_mae:+.4f}，"
+              f"与float32输出的差异: 平均 {drift.mean():.4f}，最大 {drift.max():.4f}")
+
+        passed = int8_mae - float_mae <= max_mae_delta
+        # 对比结果保留在 quantization_stats 中（model_sweep.py 使用）
+        self.quantization_stats = {
+            'float32': {'size': len(float_model), 'latency_ms': float_ms, 'mae': float_mae},
+            'int8': {'size': len(int8_model), 'latency_ms': int8_ms, 'mae': int8_mae},
+            'selected': 'int8' if passed else 'float32',
+        }
+
+        if not passed:
+            print(f"  [警告] int8模型MAE增加超过 {max_mae_delta}，C头文件使用float32模型")
+            return None
+        print(f"  int8模型通过精度检查（MAE增加不超过 {max_mae_delta}），C头文件使用int8模型")
+        return int8_path
+
+    def tflite_to_c_header(self, tflite_path, mode='header'):
+        """
+        将TFLite模型转换为固件使用的文件（写入 model_dir）
+        mode='header': chess_model.h 中的C数组（分块流式写入，不在内存中拼接整个字符串）
+        mode='binary': 原始 chess_model.bin + 用 .incbin 嵌入它的 chess_model_data.S，
+                       chess_model.h 只有声明（固件编译时不需要解析几MB的C字面量）
+        chess_model.h 中记录模型的SHA256，模型内容和输出方式都未变化时跳过生成
+        """
+        if mode not in ('header', 'binary'):
+            raise ValueError(f"未知的输出方式: {mode}")
 
         header_path = os.path.join(self.model_dir, 'chess_model.h')
-        with open(header_path, 'w') as f:
-            f.write(header_content)
+        bin_path = os.path.join(self.model_dir, 'chess_model.bin')
+        asm_path = os.path.join(self.model_dir, 'chess_model_data.S')
+
+        digest = hashlib.sha256()
+        size = 0
+        with open(tflite_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HEADER_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+
+        outputs = [header_path] + ([bin_path, asm_path] if mode == 'binary' else [])
+        if all(os.path.exists(path) for path in outputs) and _header_stamp(header_path) == (sha256, mode):
+            print(f"模型未变化（SHA256 {sha256[:12]}），跳过生成: {header_path}")
+            return header_path
+
+        stamp = (f"// Chess AI Model for ESP32\n"
+                 f"// Auto-generated TFLite model\n"
+                 f"// Size: {size} bytes\n"
+                 f"// SHA256: {sha256}\n"
+                 f"// Mode: {mode}\n")
+
+        if mode == 'binary':
+            shutil.copyfile(tflite_path, bin_path)
+            _write_atomic(asm_path, lambda f: f.write(
+                f"/* Chess AI Model for ESP32: embeds chess_model.bin (SHA256 {sha256}) */\n"
+                + MODEL_ASM))
+            _write_atomic(header_path, lambda f: f.write(stamp + MODEL_DECLARATIONS))
+            print(f"模型二进制文件已保存到: {bin_path}（由 {asm_path} 嵌入）")
+        else:
+            # 不再使用的二进制嵌入文件（固件构建时存在 chess_model_data.S 就会汇编它）
+            for path in (bin_path, asm_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            _write_atomic(header_path, lambda f: _write_c_array(f, tflite_path, stamp, size))
 
         print(f"C头文件已保存到: {header_path}")
+        return header_path
+
+
+def _header_stamp(header_path):
+    """读取已生成头文件开头记录的 (SHA256, 输出方式)，没有记录时返回None"""
+    if not os.path.exists(header_path):
+        return None
+    fields = {}
+    with open(header_path, 'r', encoding='utf-8', errors='replace') as f:
+        for _ in range(8):
+            line = f.readline()
+            if line.startswith('// ') and ': ' in line:
+                key, value = line[3:].rstrip('\n').split(': ', 1)
+                fields[key] = value
+    if 'SHA256' not in fields:
+        return None
+    return fields['SHA256'], fields.get('Mode', 'header')
+
+
+def _write_atomic(path, write):
+    """先写入临时文件再替换，中断时不会留下记录了新哈希但内容不完整的文件"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _write_c_array(f, tflite_path, stamp, size):
+    f.write(stamp)
+    f.write("\n#ifndef CHESS_MODEL_H\n#define CHESS_MODEL_H\n\n")
+    f.write("__attribute__((aligned(16))) const unsigned char chess_model_tflite[] = {\n")
+    with open(tflite_path, 'rb') as model:
+        for chunk in iter(lambda: model.read(HEADER_CHUNK_SIZE), b''):
+            lines = []
+            for start in range(0, len(chunk), HEADER_BYTES_PER_LINE):
+                row = chunk[start:start + HEADER_BYTES_PER_LINE]
+                lines.append('    ' + ''.join(map(HEX_BYTES.__getitem__, row)).rstrip() + '\n')
+            f.write(''.join(lines))
+    f.write(f"}};\n\nconst int chess_model_tflite_len = {size};\n\n#endif // CHESS_MODEL_H\n")
 
 
 def main():
     # 配置
-    data_file = "chess_training_data_with_eval.json"
+    data_file = "chess_training_data_with_eval"  # 二进制分片数据集目录（也支持JSON文件）
     model_dir = "models"
 
     print("=" * 60)
@@ -231,12 +574,14 @@ def main():
     model, history = trainer.train(
         epochs=30,
         batch_size=128,
-        max_samples=50000  # 使用5万个样本训练
+        max_samples=50000,  # 使用5万个样本训练
+        streaming=True,  # 从分片文件流式读取，按对局划分验证集
+        augment=True  # 随机颜色翻转，训练数据翻倍
     )
 
     # 转换为TFLite
     model_path = os.path.join(model_dir, 'chess_ai_model.keras')
-    trainer.convert_to_tflite(model_path, quantize=True)
+    trainer.convert_to_tflite(model_path, quantize=True, max_samples=50000)
 
     print("\n" + "=" * 60)
     print("训练完成！模型已准备好部署到ESP32")
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+异步UCI引擎客户端（asyncio）
+读取引擎输出不阻塞事件循环，每条命令都有截止时间：
+搜索超时先发送 stop 取回已完成深度的结果，引擎仍无响应则结束进程并自动重启，
+一个卡住的引擎不会拖住整个标注任务；多个引擎可以在同一个事件循环中并发运行
+"""
+
+import asyncio
+import subprocess
+
+
+class EngineError(Exception):
+    """引擎无法启动，或重启次数超过上限"""
+
+
+def parse_info(info_line):
+    """
+    从UCI的info行中解析原始分数、深度和节点数
+    返回 {'score_type': 'cp'/'mate', 'score': 整数, 'depth': 深度, 'nodes': 节点数}，
+    没有分数时返回None
+    """
+    try:
+        # 示例: info depth 15 seldepth 29 score cp 50 nodes 123456 ...
+        # 或: info depth 15 seldepth 29 score mate 3 ...
+        parts = info_line.split()
+
+        score_index = parts.index("score")
+        score_type = parts[score_index + 1]
+        if score_type not in ("cp", "mate"):
+            return None
+        info = {'score_type': score_type, 'score': int(parts[score_index + 2])}
+        for key in ("depth", "nodes"):
+            if key in parts:
+                info[key] = int(parts[parts.index(key) + 1])
+        return info
+    except (ValueError, IndexError):
+        return None
+
+
+def position_command(fen=None, root_fen=None, moves=None):
+    """
+    生成 position 命令: 给出 fen 时为 position fen <fen>，
+    否则从 root_fen（None 为标准初始局面）沿 moves 走到当前局面
+    """
+    if fen:
+        return f"position fen {fen}"
+    command = f"position fen {root_fen}" if root_fen else "position startpos"
+    if moves:
+        command += " moves " + " ".join(moves)
+    return command
+
+
+class AsyncUciEngine:
+    """
+    单个UCI引擎进程
+    search_timeout: 单次搜索的最长时间（秒），超时后发送 stop
+    stop_timeout: 发送 stop 后等待 bestmove 的时间，仍无响应则重启引擎
+    command_timeout: uci/isready 等命令的响应时间
+    max_restarts: 连续自动重启次数上限（两次重启之间没有成功完成的搜索），超过后抛出 EngineError；
+                  偶尔的超时重启在下一次搜索成功后清零，不会让长时间的标注任务中止
+    """
+
+    def __init__(self, path, threads=None, hash_mb=None, depth=15, search_timeout=60,
+                 stop_timeout=5, command_timeout=30, max_restarts=3):
+        self.path = path
+        self.threads = threads
+        self.hash_mb = hash_mb
+        self.depth = depth
+        self.search_timeout = search_timeout
+        self.stop_timeout = stop_timeout
+        self.command_timeout = command_timeout
+        self.max_restarts = max_restarts
+        self.process = None
+        self.restarts = 0  # 累计重启次数（用于报告）
+        self.consecutive_restarts = 0
+        self.timeouts = 0
+
+    async def start(self):
+        """启动引擎进程并完成UCI初始化"""
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                self.path,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError as e:
+            raise EngineError(f"无法启动引擎 {self.path}: {e}") from e
+
+        try:
+            await self.send("uci")
+            await self.read_until("uciok", self.command_timeout)
+            await self.send("setoption name MultiPV value 1")
+            if self.threads:
+                await self.send(f"setoption name Threads value {self.threads}")
+            if self.hash_mb:
+                await self.send(f"setoption name Hash value {self.hash_mb}")
+            await self.ready()
+        except (asyncio.TimeoutError, EOFError, ConnectionError) as e:
+            await self._kill()
+            raise EngineError(f"引擎初始化失败 {self.path}: {e!r}") from e
+
+    async def send(self, command):
+        """发送一条命令"""
+        self.process.stdin.write((command + "\n").encode('ascii'))
+        await self.process.stdin.drain()
+
+    async def _readline(self, deadline):
+        loop = asyncio.get_running_loop()
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        line = await asyncio.wait_for(self.process.stdout.readline(), remaining)
+        if not line:
+            raise EOFError("引擎已退出")
+        return line.decode('utf-8', 'replace').strip()
+
+    async def read_until(self, expected_text, timeout):
+        """读取输出直到出现 expected_text，返回读到的所有行；超时抛出 asyncio.TimeoutError"""
+        deadline = asyncio.get_running_loop().time() + timeout
+        lines = []
+        while True:
+            line = await self._readline(deadline)
+            lines.append(line)
+            if expected_text in line:
+                return lines
+
+    async def ready(self):
+        await self.send("isready")
+        await self.read_until("readyok", self.command_timeout)
+
+    async def new_game(self):
+        """开始新对局（清空置换表）"""
+        try:
+            await self.send("ucinewgame")
+            await self.ready()
+        except (asyncio.TimeoutError, EOFError, ConnectionError):
+            await self.restart()
+
+    async def analyse(self, position, depth=None, nodes=None):
+        """
+        搜索一个局面，返回最后一条带分数的info（见 parse_info）
+        position: position 命令（见 position_command）
+        超时时返回 stop 之前已完成深度的结果；引擎无响应或退出时重启引擎并返回None
+        """
+        try:
+            info = await self._search(position, depth, nodes)
+        except (asyncio.TimeoutError, EOFError, ConnectionError):
+            await self.restart()
+            return None
+        self.consecutive_restarts = 0
+        return info
+
+    async def _search(self, position, depth, nodes):
+        loop = asyncio.get_running_loop()
+        await self.send(position)
+        if nodes:
+            await self.send(f"go nodes {nodes}")
+        else:
+            await self.send(f"go depth {depth or self.depth}")
+
+        info = None
+        deadline = loop.time() + self.search_timeout
+        stopped = False
+        while True:
+            try:
+                line = await self._readline(deadline)
+            except asyncio.TimeoutError:
+                if stopped:
+                    raise
+                # 超时: 要求引擎立即给出结果，再给它 stop_timeout 秒
+                self.timeouts += 1
+                stopped = True
+                await self.send("stop")
+                deadline = loop.time() + self.stop_timeout
+                continue
+
+            if line.startswith("info") and " score " in line:
+                # 不立即返回，继续等待更深的结果
+                info = parse_info(line) or info
+            elif line.startswith("bestmove"):
+                return info
+
+    async def restart(self):
+        """结束当前进程并重新启动引擎"""
+        self.restarts += 1
+        self.consecutive_restarts += 1
+        if self.consecutive_restarts > self.max_restarts:
+            await self._kill()
+            raise EngineError(f"引擎连续重启次数超过上限 ({self.max_restarts})")
+        await self._kill()
+        await self.start()
+
+    async def _kill(self):
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            self.process.kill()
+        await self.process.wait()
+        self.process = None
+
+    async def quit(self):
+        """正常退出引擎，超时则强制结束"""
+        if self.process is None:
+            return
+        try:
+            await self.send("quit")
+            await asyncio.wait_for(self.process.wait(), self.stop_timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        await self._kill()